@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from RecalibratingTrackingSimulator import RecalibrationStats
+from WhatIfEvaluator import WhatIfEvaluator
+
+
+class WhatIfSnapshot:
+    """
+    Copy of what a recalibration search needs from a RecalibratingTrackingSimulator over one window:
+    its flat what-if model, with the recorded inputs, the tracked solutions, and the search settings.
+    It has the methods that the searches call on the simulator, so a search can run on it in another process,
+    while the simulator keeps stepping.
+    """
+
+    def __init__(self, simulator, whatif, t0, tf, tracked_solutions, error_space):
+        self.whatif = whatif
+        self.t0 = t0
+        self.tf = tf
+        self.tracked_solutions = tracked_solutions
+        self.error_space = error_space
+        self.max_iterations = simulator.max_iterations
+        self.conv_xatol = simulator.conv_xatol
+        self.conv_fatol = simulator.conv_fatol
+        self.time_step = simulator.time_step
+        self.whatif_solver = simulator.whatif_solver
+        # Worker processes are not started from the snapshot's process.
+        self.whatif_evaluator = WhatIfEvaluator(early_abort=simulator.whatif_evaluator.early_abort)
+        # The simulator's whatif_cache stays in the simulator's process.
+        self.whatif_cache = None
+        self.stats = RecalibrationStats()
+
+    def search(self, recalibration_search, guess, warm_start=None):
+        # Returns the search result, and the stats of the search, as they are not seen by the simulator's process.
+        start = time.perf_counter()
+        result = recalibration_search.search(self, guess, self.t0, self.tf, self.tracked_solutions, self.error_space,
+                                             warm_start=warm_start)
+        self.stats.wall_time = time.perf_counter() - start
+        return result, self.stats
+
+    def whatif_flat(self, t0, tf):
+        return self.whatif
+
+    def run_whatif_simulation(self, new_parameters, t0, tf, tracked_solutions, error_space):
+        return self.run_whatif_batch([new_parameters], t0, tf, tracked_solutions, error_space)[0]
+
+    def evaluate_candidate(self, parameters, t0, tf, tracked_solutions, error_space, bound=None):
+        return self.whatif_evaluator.evaluate_candidate(self, parameters, t0, tf, tracked_solutions, error_space, bound)
+
+    def evaluate_candidates(self, candidates, t0, tf, tracked_solutions, error_space, bound=None):
+        return self.whatif_evaluator.evaluate_candidates(self, candidates, t0, tf, tracked_solutions, error_space,
+                                                         bound)
+
+    def run_whatif_batch(self, candidates, t0, tf, tracked_solutions, error_space):
+        return self.whatif_evaluator.run_batch(self, candidates, t0, tf, tracked_solutions, error_space)
+
+    def run_whatif_sensitivity(self, parameters, t0, tf, tracked_solutions, error_space):
+        return self.whatif_evaluator.run_sensitivity(self, parameters, t0, tf, tracked_solutions, error_space)
+
+
+class BackgroundRecalibration:
+    """
+    Runs the searches of a RecalibratingTrackingSimulator in a worker process, on a WhatIfSnapshot of the window,
+    while the tracking model keeps stepping with the old parameters. Set it as the background_recalibration
+    of the simulator. Once the search is done, the simulator simulates the new parameters from the start of the window
+    up to the current time, and restarts the tracking model from there.
+    Simulators with no flat what-if model recalibrate right away, as usual.
+    stop waits for the pending search, if any, and stops the worker process.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = None
+
+    def submit(self, simulator, t0, tf, tracked_solutions, error_space, guess, warm_start, started):
+        # Starts the search of the window [t0, tf], unless the simulator has no flat what-if model.
+        # Returns whether it was started. started is given back by result.
+        whatif = simulator.whatif_flat(t0, tf)
+        if whatif is None:
+            return False
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1)
+        snapshot = WhatIfSnapshot(simulator, whatif, t0, tf, tracked_solutions, error_space)
+        future = self._executor.submit(snapshot.search, simulator.recalibration_search, guess, warm_start)
+        self._pending = (t0, tf, future, started)
+        return True
+
+    def pending(self):
+        return self._pending is not None
+
+    def done(self):
+        return self._pending is not None and self._pending[2].done()
+
+    def result(self):
+        # Returns the window, the result and stats of the pending search, and the started given to submit.
+        t0, tf, future, started = self._pending
+        self._pending = None
+        result, stats = future.result()
+        return t0, tf, result, stats, started
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._pending = None
@@ -0,0 +1,75 @@
+import numpy as np
+
+from RecalibratingTrackingSimulator import SearchResult
+
+
+class BatchGridSearch:
+    """
+    Derivative-free parameter search for RecalibratingTrackingSimulator.
+    Each iteration evaluates a grid of batch_size candidates per parameter in a single call to run_whatif_batch,
+    and then narrows the grid around the best candidate, unless the best one is at the edge of the grid,
+    in which case the grid moves there and keeps its width, as the minimum may lie beyond it.
+    Stops when the grid spacing is below conv_xatol, the costs in the grid differ less than conv_fatol,
+    or after max_iterations.
+    With early_abort (see WhatIfEvaluator), the candidates worse than the best one by more than conv_fatol
+    are abandoned, and their costs are only lower bounds. The others are integrated as without early abort
+    (see FlatWhatIf.simulate_costs), so the best candidate is the same,
+    but the costs in the grid may seem to differ less than they do, so the search can stop earlier, at another point.
+    When warm started, the grid starts twice as wide as the distance the previous search moved the parameters,
+    as the parameters are expected to drift by similar amounts between recalibrations,
+    but no narrower than warm_spread, relative to the guess, so that a step change of the parameters
+    after a search that converged is still within reach.
+    """
+
+    def __init__(self, batch_size=16, spread=0.5, warm_spread=0.1):
+        assert batch_size >= 3
+        self.batch_size = batch_size
+        # Initial half-width of the grid, relative to the guess.
+        self.spread = spread
+        self.warm_spread = warm_spread
+
+    def search(self, simulator, guess, t0, tf, tracked_solutions, error_space, warm_start=None):
+        best = np.array(guess, dtype=float)
+        best_cost = np.inf
+        initial_cost = None
+        span = np.where(best != 0.0, np.abs(best) * self.spread, self.spread)
+        if warm_start is not None and warm_start.state is not None:
+            span = np.minimum(span, np.maximum(2.0 * warm_start.state, simulator.conv_xatol * self.batch_size))
+            span = np.maximum(span, np.abs(best) * self.warm_spread)
+        offsets = np.linspace(-1.0, 1.0, self.batch_size)
+        iterations = 0
+        converged = False
+        while not converged and iterations < simulator.max_iterations:
+            iterations += 1
+            converged = True
+            for i in range(len(best)):
+                candidates = np.tile(best, (self.batch_size, 1))
+                candidates[:, i] += offsets * span[i]
+                # Candidates worse than the best one by more than conv_fatol may be abandoned (see WhatIfEvaluator).
+                # Their costs are then lower bounds, still above best_cost + conv_fatol, so they cannot be chosen
+                # as the best candidate, but they can understate how much the costs differ.
+                # The guess is only in the middle of the first grid when batch_size is odd.
+                # Otherwise, it is evaluated in the same batch as the first grid, to report its cost.
+                with_guess = initial_cost is None and self.batch_size % 2 == 0
+                if with_guess:
+                    candidates = np.vstack([candidates, guess])
+                costs = simulator.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space,
+                                                      bound=best_cost + simulator.conv_fatol)
+                if with_guess:
+                    initial_cost, costs, candidates = costs[-1], costs[:-1], candidates[:-1]
+                elif initial_cost is None:
+                    initial_cost = costs[self.batch_size // 2]
+                k = np.argmin(costs)
+                if costs[k] < best_cost:
+                    best = candidates[k]
+                    best_cost = costs[k]
+                    if k in (0, self.batch_size - 1):
+                        converged = False
+                        continue
+                spacing = 2.0 * span[i] / (self.batch_size - 1)
+                # Keep the neighbours of the best candidate inside the next grid.
+                span[i] = 2.0 * spacing
+                if spacing > simulator.conv_xatol and costs.max() - costs.min() > simulator.conv_fatol:
+                    converged = False
+
+        return SearchResult(best, best_cost, iterations, state=np.abs(best - guess), initial_cost=initial_cost)
@@ -0,0 +1,85 @@
+import numpy as np
+import scipy.integrate
+from scipy.integrate import RK45
+
+from FixedStepSolver import FIXED_STEP_METHODS, fixed_step_solve
+
+
+class BatchSolver:
+    """
+    Simulates many copies of the same flat model together, as a single system.
+    The states are stacked as an (nstates x N) array, one column per copy,
+    and rhs(t, s) must return the derivatives with the same shape.
+    method is RK45, or one of FIXED_STEP_METHODS, which step all copies with no flattening.
+    When breakpoints are given, e.g., those of the steering profile shared by all copies, the integration stops
+    at each of them, so that no step crosses a kink of the inputs.
+    max_stable_step is given to fixed_step_solve, so that callers integrating a window piece by piece
+    estimate the stable step once (see stable_step).
+    samples gives the states at each output time as they are integrated, e.g., to stop once they are not needed.
+    """
+
+    def __init__(self, method=RK45):
+        self.method = method
+
+    def simulate(self, rhs, x0, t0, tf, h, t_eval, breakpoints=(), max_stable_step=None):
+        if self.method in FIXED_STEP_METHODS:
+            return fixed_step_solve(self.method, rhs, t0, x0, t_eval, h, breakpoints, max_stable_step)
+        nstates, n = x0.shape
+        ys = solve_ivp_with_breakpoints(flat_rhs(rhs, x0.shape), t0, tf, x0.reshape(-1), t_eval, breakpoints,
+                                        method=self.method, max_step=h)
+        # Shape (nstates, N, len(t_eval))
+        return ys.reshape(nstates, n, -1)
+
+    def samples(self, rhs, x0, t0, tf, h, t_eval, breakpoints=()):
+        # The states of simulate at each time of t_eval, with shape (nstates, N), integrated as they are iterated
+        # over, so that the integration stops when the iteration does. Only for solve_ivp methods.
+        assert self.method not in FIXED_STEP_METHODS
+        for y in ivp_samples(flat_rhs(rhs, x0.shape), t0, tf, x0.reshape(-1), t_eval, breakpoints,
+                             method=self.method, max_step=h):
+            yield y.reshape(x0.shape)
+
+
+def flat_rhs(rhs, shape):
+    # rhs of states with the given shape, as a function of the flattened states, as solve_ivp integrates them.
+    def f(t, y):
+        return rhs(t, y.reshape(shape)).reshape(-1)
+    return f
+
+
+def solve_ivp_with_breakpoints(f, t0, tf, y0, t_eval, breakpoints, **options):
+    # As solve_ivp(f, (t0, tf), y0, t_eval=t_eval, **options).y, but with one solver between consecutive
+    # breakpoints inside (t0, tf), so that no step crosses them.
+    ys = np.empty((len(y0), len(t_eval)))
+    for k, y in enumerate(ivp_samples(f, t0, tf, y0, t_eval, breakpoints, **options)):
+        ys[:, k] = y
+    return ys
+
+
+def ivp_samples(f, t0, tf, y0, t_eval, breakpoints, method='RK45', **options):
+    # The states of solve_ivp_with_breakpoints at each time of t_eval, in order, integrated as they are iterated over.
+    # As in solve_ivp, the states between the steps of a solver are given by its dense output,
+    # which also gives the state at each breakpoint, where the next solver starts.
+    if isinstance(method, str):
+        method = getattr(scipy.integrate, method)
+    t_eval = np.asarray(t_eval, dtype=float)
+    breakpoints = np.asarray(breakpoints, dtype=float)
+    ends = list(np.unique(breakpoints[(breakpoints > t0) & (breakpoints < tf)])) + [tf]
+    t, y = t0, np.asarray(y0, dtype=float)
+    k = 0
+    for end in ends:
+        stop = np.searchsorted(t_eval, end, side='left')
+        solver = method(f, t, y, end, **options)
+        while solver.status == 'running':
+            solver.step()
+            assert solver.status != 'failed', solver.message
+            j = min(np.searchsorted(t_eval, solver.t, side='right'), stop)
+            finished = solver.status == 'finished'
+            if j > k or finished:
+                ts = np.append(t_eval[k:j], end) if finished else t_eval[k:j]
+                ys = solver.dense_output()(ts)
+                for i in range(j - k):
+                    yield ys[:, i]
+                k = j
+        t, y = end, ys[:, -1]
+    for _ in range(k, len(t_eval)):
+        yield y
@@ -0,0 +1,214 @@
+"""
+Headless benchmarks of the models and tracking simulators.
+Results are written as JSON, to compare runs, e.g., before and after a change:
+    python Benchmarks.py --output benchmarks.json
+"""
+import argparse
+import json
+import platform
+import time
+from random import seed
+
+import numpy as np
+from oomodelling.ModelSolver import ModelSolver
+
+from BikeDynamicModel import BikeDynamicModel
+from BikeDynamicModelSpeedDriven import BikeDynamicModelSpeedDriven
+from BikeKinematicModel import BikeKinematicModel
+from BikeTrackingWithDynamic import BikeTrackingSimulatorDynamic
+from BikeTrackingWithDynamicWithoutStateRestore import BikeTrackingWithDynamicWithoutStateRestore
+from BikeTrackingWithInputScenario import BikeTrackingWithInputScenario
+from ModelStepper import ModelStepper
+from NelderMeadSearch import NelderMeadSearch
+from RobottiDynamicModel import RobottiDynamicModel
+from RobottiTrackingSimulator import RobottiTrackingSimulator
+from RobottiTrackingSimulatorRandomNoise import RobottiTrackingSimulatorRandomNoise
+
+
+def rhs_evaluations_per_second(f, x, duration):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for _ in range(100):
+            f(0.0, x)
+        n += 100
+    return n / (time.perf_counter() - start)
+
+
+def benchmark_rhs(duration):
+    results = {}
+    for model in [BikeKinematicModel, BikeDynamicModel, BikeDynamicModelSpeedDriven, RobottiDynamicModel]:
+        m = model()
+        x = m.state_vector() + np.linspace(0.1, 0.5, m.nstates())
+        results[model.__name__] = rhs_evaluations_per_second(m.derivatives(), x, duration)
+        if hasattr(m, 'compile_derivatives'):
+            results[model.__name__ + '.compiled'] = rhs_evaluations_per_second(m.compile_derivatives(), x, duration)
+    return results
+
+
+def dynamic_scenario():
+    m = BikeTrackingSimulatorDynamic()
+    m.tolerance = 0.02
+    m.horizon = 5.0
+    m.cooldown = 5.0
+    m.nsamples = 10
+    m.time_step = 0.1
+    m.conv_xatol = 30.0
+    m.conv_fatol = 1.0
+    m.to_track.ddriver.nperiods = 2
+    return m, 60.0
+
+
+def dynamic_without_state_restore_scenario():
+    m = BikeTrackingWithDynamicWithoutStateRestore()
+    m.tolerance = 0.2
+    m.horizon = 5.0
+    m.cooldown = 5.0
+    m.nsamples = 10
+    m.max_iterations = 20
+    m.time_step = 0.1
+    m.conv_xatol = 1e3
+    m.conv_fatol = 0.01
+    m.to_track.ddriver.nperiods = 2
+    return m, 40.0
+
+
+def robotti_scenario():
+    m = RobottiTrackingSimulator()
+    m.tolerance = 0.1
+    m.horizon = 2.0
+    m.max_iterations = 20
+    m.cooldown = 5.0
+    m.nsamples = 20
+    m.time_step = 0.1
+    m.conv_xatol = 0.1
+    m.conv_fatol = 0.1
+    return m, 15.0
+
+
+def robotti_random_noise_scenario():
+    m = RobottiTrackingSimulatorRandomNoise()
+    m.driver.width = 8.0
+    m.driver.nperiods = 2
+    m.robot.Caf = lambda: 200000
+    m.tolerance = 1e10
+    m.horizon = 20.0
+    m.max_iterations = 20
+    m.cooldown = 10.0
+    m.nsamples = 20
+    m.time_step = 0.1
+    m.conv_xatol = 1e3
+    m.conv_fatol = 0.1
+    return m, 60.0
+
+
+SCENARIOS = {
+    'BikeTrackingSimulatorDynamic': dynamic_scenario,
+    'BikeTrackingWithDynamicWithoutStateRestore': dynamic_without_state_restore_scenario,
+    'RobottiTrackingSimulator': robotti_scenario,
+    'RobottiTrackingSimulatorRandomNoise': robotti_random_noise_scenario,
+}
+
+
+def benchmark_scenario(make_scenario):
+    seed(1)
+    m, stop_time = make_scenario()
+    # Nelder-Mead, as TrackingSimulator, but accepting the best point at max_iterations (see NelderMeadSearch),
+    # and recording the latency and what-if simulations of each recalibration.
+    m.recalibration_search = NelderMeadSearch()
+
+    start = time.perf_counter()
+    ModelSolver().simulate(m, 0.0, stop_time, 0.1)
+    return {
+        'stop_time': stop_time,
+        'wall_time': time.perf_counter() - start,
+        'recalibrations': len(m.recalibration_history),
+        'recalibration_latency': [r.wall_time for r in m.recalibration_history],
+        'whatif_simulations': [r.whatif_simulations for r in m.recalibration_history],
+    }
+
+
+def benchmark_stepping(stop_time, step_size):
+    # Latency of each co-simulation step of the model inside the BicycleTracking FMU, as its do_step does it.
+    seed(1)
+    m = BikeTrackingWithInputScenario()
+    m.tracking.tolerance = 0.2
+    m.tracking.horizon = 5.0
+    m.tracking.cooldown = 5.0
+    m.tracking.nsamples = 10
+    m.tracking.max_iterations = 20
+    m.tracking.time_step = 0.1
+    m.tracking.conv_xatol = 1e3
+    m.tracking.conv_fatol = 0.01
+    m.to_track.ddriver.nperiods = 2
+
+    stepper = ModelStepper(m)
+    latencies = []
+    for i in range(int(round(stop_time / step_size))):
+        start = time.perf_counter()
+        stepper.step(i*step_size, step_size)
+        m.discrete_step()
+        latencies.append(time.perf_counter() - start)
+    return {
+        'steps': len(latencies),
+        'step_size': step_size,
+        'latency_percentiles': {str(q): float(np.percentile(latencies, q)) for q in [50, 90, 99, 100]},
+    }
+
+
+def benchmark_whatif(step_size, stop_time=15.0, repeats=3):
+    # Wall time of a batch of what-if simulations in the BicycleTracking FMU, whose window is sampled at every
+    # co-simulation step, with breakpoints only where the recorded steering changes, as WindowInterpolant sets them,
+    # and, for comparison, at every sample.
+    seed(1)
+    m = BikeTrackingWithInputScenario()
+    m.tracking.tolerance = 1e10
+    m.tracking.horizon = 5.0
+    m.tracking.nsamples = 10
+    m.tracking.time_step = 0.1
+    m.to_track.ddriver.nperiods = 2
+
+    stepper = ModelStepper(m)
+    for i in range(int(round(stop_time / step_size))):
+        stepper.step(i*step_size, step_size)
+        m.discrete_step()
+
+    tracking = m.tracking
+    tf = tracking.time()
+    t0 = tf - tracking.horizon
+    error_space = np.linspace(t0, tf, tracking.nsamples)
+    candidates = np.linspace(0.5, 1.5, 16)[:, None] * tracking.get_parameter_guess()
+    whatif = tracking.whatif_flat(t0, tf)
+    results = {'step_size': step_size, 'samples': len(whatif.deltaf.times)}
+    for name, breakpoints in [('changes', whatif.breakpoints), ('every_sample', whatif.deltaf.times)]:
+        whatif.breakpoints = breakpoints
+        nfev = whatif.nfev
+        start = time.perf_counter()
+        for _ in range(repeats):
+            whatif.simulate_batch(candidates, t0, tf, tracking.time_step, error_space)
+        results[name] = {
+            'breakpoints': len(breakpoints),
+            'wall_time': (time.perf_counter() - start) / repeats,
+            'rhs_evaluations': (whatif.nfev - nfev) // repeats,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the models and tracking simulators.")
+    parser.add_argument("--output", default="benchmarks.json", help="JSON file where the results are written.")
+    parser.add_argument("--rhs-duration", type=float, default=1.0, help="Seconds spent timing each derivative function.")
+    parser.add_argument("--step-stop-time", type=float, default=25.0, help="Stop time of the stepping benchmark.")
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rhs_evaluations_per_second': benchmark_rhs(args.rhs_duration),
+        'scenarios': {name: benchmark_scenario(make) for name, make in SCENARIOS.items()},
+        'stepping': benchmark_stepping(args.step_stop_time, 0.01),
+        'whatif_breakpoints': benchmark_whatif(0.01),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results written to {}.".format(args.output))
@@ -1,7 +1,10 @@
 import math
 
+import numpy as np
 from oomodelling.Model import Model
 
+from FlatModel import held, flat_derivatives, flat_jacobian
+
 
 class BikeDynamicModel(Model):
     def __init__(self):
@@ -38,7 +41,70 @@ class BikeDynamicModel(Model):
 
         self.save()
 
+    def compile_derivatives(self, deltaf=None, a=None):
+        # Flat alternative to self.derivatives(), usable directly as the f given to solve_ivp.
+        # Parameters, and the inputs that are not given as functions of time, are bound to their current value.
+        deltaf = deltaf if deltaf is not None else held(self.deltaf())
+        a = a if a is not None else held(self.a())
+        Caf, lf, lr, m, Iz, Car = self.Caf(), self.lf, self.lr, self.m, self.Iz, self.Car
+        return flat_derivatives(self, BIKE_DYNAMIC_STATES,
+                                lambda t, s: bike_dynamic_derivatives(s, Caf, deltaf(t), a(t), lf, lr, m, Iz, Car))
+
+    def compile_jacobian(self, deltaf=None, a=None):
+        # Jacobian of compile_derivatives(deltaf, a) with respect to the state vector, e.g., for the jac of BDF or Radau.
+        deltaf = deltaf if deltaf is not None else held(self.deltaf())
+        Caf, lf, lr, m, Iz, Car = self.Caf(), self.lf, self.lr, self.m, self.Iz, self.Car
+        return flat_jacobian(self, BIKE_DYNAMIC_STATES,
+                             lambda t, s: bike_dynamic_jacobian(s, Caf, deltaf(t), lf, lr, m, Iz, Car))
+
+
+# State order used by bike_dynamic_derivatives. Matches the order in which BikeDynamicModel declares its states.
+BIKE_DYNAMIC_STATES = ('x', 'X', 'Y', 'vx', 'y', 'vy', 'psi', 'dpsi')
+
+
+def bike_dynamic_derivatives(s, Caf, deltaf, a, lf, lr, m, Iz, Car):
+    # Same equations as BikeDynamicModel, but over a plain state array ordered as BIKE_DYNAMIC_STATES.
+    # Each row of s may also be an array, in which case many bikes are evaluated at once.
+    x, X, Y, vx, y, vy, psi, dpsi = s
+    af = deltaf - (vy + lf*dpsi)/vx
+    ar = (vy - lr*dpsi)/vx
+    Fcf = Caf*af
+    Fcr = Car*(-ar)
+    return np.array([
+        vx,
+        vx*np.cos(psi) - vy*np.sin(psi),
+        vx*np.sin(psi) + vy*np.cos(psi),
+        dpsi*vy + a,
+        vy,
+        -dpsi*vx + (1/m)*(Fcf*np.cos(deltaf) + Fcr),
+        dpsi,
+        (2/Iz)*(lf*Fcf - lr*Fcr),
+    ])
 
 
+def bike_dynamic_jacobian(s, Caf, deltaf, lf, lr, m, Iz, Car):
+    # Analytic Jacobian of bike_dynamic_derivatives with respect to s.
+    x, X, Y, vx, y, vy, psi, dpsi = s
+    # Partial derivatives of the tyre forces with respect to vx, vy and dpsi.
+    dFcf = Caf*np.array([(vy + lf*dpsi)/vx**2, -1/vx, -lf/vx])
+    dFcr = -Car*np.array([-(vy - lr*dpsi)/vx**2, 1/vx, -lr/vx])
+    dvy = (np.cos(deltaf)*dFcf + dFcr)/m
+    ddpsi = (2/Iz)*(lf*dFcf - lr*dFcr)
+    VX, VY, PSI, DPSI = 3, 5, 6, 7
+    J = np.zeros((8, 8))
+    J[0, VX] = 1.0
+    J[1, [VX, VY, PSI]] = [np.cos(psi), -np.sin(psi), -vx*np.sin(psi) - vy*np.cos(psi)]
+    J[2, [VX, VY, PSI]] = [np.sin(psi), np.cos(psi), vx*np.cos(psi) - vy*np.sin(psi)]
+    J[3, [VY, DPSI]] = [dpsi, vy]
+    J[4, VY] = 1.0
+    J[5, [VX, VY, DPSI]] = dvy + [-dpsi, 0.0, -vx]
+    J[6, DPSI] = 1.0
+    J[7, [VX, VY, DPSI]] = ddpsi
+    return J
 
 
+def bike_dynamic_jacobian_caf(s, deltaf, lf, m, Iz):
+    # Derivative of bike_dynamic_derivatives with respect to Caf.
+    x, X, Y, vx, y, vy, psi, dpsi = s
+    af = deltaf - (vy + lf*dpsi)/vx
+    return np.array([0.0, 0.0, 0.0, 0.0, 0.0, (1/m)*af*np.cos(deltaf), 0.0, (2/Iz)*lf*af])
@@ -1,7 +1,10 @@
 import math
 
+import numpy as np
 from oomodelling.Model import Model
 
+from FlatModel import held, flat_derivatives, flat_jacobian
+
 
 # TODO: We should be able to use class hierarchy to better implement this model by reusing the BikeDynamicModel.
 class BikeDynamicModelSpeedDriven(Model):
@@ -37,7 +40,68 @@ class BikeDynamicModelSpeedDriven(Model):
 
         self.save()
 
+    def compile_derivatives(self, deltaf=None, vx=None):
+        # Flat alternative to self.derivatives(), usable directly as the f given to solve_ivp.
+        # Parameters, and the inputs that are not given as functions of time, are bound to their current value.
+        deltaf = deltaf if deltaf is not None else held(self.deltaf())
+        vx = vx if vx is not None else held(self.vx())
+        Caf, lf, lr, m, Iz, Car = self.Caf(), self.lf, self.lr, self.m, self.Iz, self.Car
+        return flat_derivatives(self, BIKE_SPEED_DRIVEN_STATES,
+                                lambda t, s: bike_speed_driven_derivatives(s, Caf, deltaf(t), vx(t), lf, lr, m, Iz, Car))
+
+    def compile_jacobian(self, deltaf=None, vx=None):
+        # Jacobian of compile_derivatives(deltaf, vx) with respect to the state vector, e.g., for the jac of BDF or Radau.
+        deltaf = deltaf if deltaf is not None else held(self.deltaf())
+        vx = vx if vx is not None else held(self.vx())
+        Caf, lf, lr, m, Iz, Car = self.Caf(), self.lf, self.lr, self.m, self.Iz, self.Car
+        return flat_jacobian(self, BIKE_SPEED_DRIVEN_STATES,
+                             lambda t, s: bike_speed_driven_jacobian(s, Caf, deltaf(t), vx(t), lf, lr, m, Iz, Car))
+
+
+# State order used by bike_speed_driven_derivatives. Matches the order in which BikeDynamicModelSpeedDriven declares its states.
+BIKE_SPEED_DRIVEN_STATES = ('x', 'X', 'Y', 'y', 'vy', 'psi', 'dpsi')
+
+
+def bike_speed_driven_derivatives(s, Caf, deltaf, vx, lf, lr, m, Iz, Car):
+    # Same equations as BikeDynamicModelSpeedDriven, but over a plain state array ordered as BIKE_SPEED_DRIVEN_STATES.
+    # Each row of s may also be an array, in which case many bikes are evaluated at once.
+    x, X, Y, y, vy, psi, dpsi = s
+    af = deltaf - (vy + lf*dpsi)/vx
+    ar = (vy - lr*dpsi)/vx
+    Fcf = Caf*af
+    Fcr = Car*(-ar)
+    return np.array([
+        vx*np.ones_like(vy),  # vx is an input, so it has to be broadcast to the shape of the states.
+        vx*np.cos(psi) - vy*np.sin(psi),
+        vx*np.sin(psi) + vy*np.cos(psi),
+        vy,
+        -dpsi*vx + (1/m)*(Fcf*np.cos(deltaf) + Fcr),
+        dpsi,
+        (2/Iz)*(lf*Fcf - lr*Fcr),
+    ])
 
 
+def bike_speed_driven_jacobian(s, Caf, deltaf, vx, lf, lr, m, Iz, Car):
+    # Analytic Jacobian of bike_speed_driven_derivatives with respect to s.
+    x, X, Y, y, vy, psi, dpsi = s
+    # Partial derivatives of the tyre forces with respect to vy and dpsi.
+    dFcf = Caf*np.array([-1/vx, -lf/vx])
+    dFcr = -Car*np.array([1/vx, -lr/vx])
+    dvy = (np.cos(deltaf)*dFcf + dFcr)/m
+    ddpsi = (2/Iz)*(lf*dFcf - lr*dFcr)
+    VY, PSI, DPSI = 4, 5, 6
+    J = np.zeros((7, 7))
+    J[1, [VY, PSI]] = [-np.sin(psi), -vx*np.sin(psi) - vy*np.cos(psi)]
+    J[2, [VY, PSI]] = [np.cos(psi), vx*np.cos(psi) - vy*np.sin(psi)]
+    J[3, VY] = 1.0
+    J[4, [VY, DPSI]] = dvy + [0.0, -vx]
+    J[5, DPSI] = 1.0
+    J[6, [VY, DPSI]] = ddpsi
+    return J
 
 
+def bike_speed_driven_jacobian_caf(s, deltaf, vx, lf, m, Iz):
+    # Derivative of bike_speed_driven_derivatives with respect to Caf.
+    x, X, Y, y, vy, psi, dpsi = s
+    af = deltaf - (vy + lf*dpsi)/vx
+    return np.array([0.0, 0.0, 0.0, 0.0, (1/m)*af*np.cos(deltaf), 0.0, (2/Iz)*lf*af])
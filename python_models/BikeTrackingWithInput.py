@@ -2,13 +2,14 @@ from random import random
 
 import numpy as np
 
-from BikeDynamicModel import BikeDynamicModel
+from BikeDynamicModel import BikeDynamicModel, BIKE_DYNAMIC_STATES
 from BikeDynamicModelWithDriver import BikeDynamicModelWithDriver
-from oomodelling.ModelSolver import ModelSolver
-from oomodelling.TrackingSimulator import TrackingSimulator
 
+from FlatWhatIf import BikeDynamicWhatIf
+from RecalibratingTrackingSimulator import RecalibratingTrackingSimulator
 
-class BikeTrackingWithInput(TrackingSimulator):
+
+class BikeTrackingWithInput(RecalibratingTrackingSimulator):
     def __init__(self):
         super().__init__()
 
@@ -33,35 +34,40 @@ class BikeTrackingWithInput(TrackingSimulator):
 
     def run_whatif_simulation(self, new_parameters, t0, tf, tracked_solutions, error_space, only_tracked_state=True):
         new_caf = new_parameters[0]
-        m = BikeDynamicModel()
-        m.Caf = lambda: new_caf
-        # Rewrite control input to mimic the past behavior.
-        m.deltaf = lambda: self.to_track_delta(-(tf - m.time()))
+        deltaf = self.past_signal(self, 'to_track_delta', t0, tf)
         assert np.isclose(self.to_track_X(-(tf - t0)), tracked_solutions[0][0])
         assert np.isclose(self.to_track_Y(-(tf - t0)), tracked_solutions[1][0])
         # Set the state to the past state: This is the main different wrt to BikeTrackingWithDynamic.
         # Here, the state is set to the inaccurate past state.
-        m.x = self.tracking.x(-(tf - t0))
-        m.X = self.to_track_X(-(tf - t0))
-        m.y = self.tracking.y(-(tf - t0))
-        m.Y = self.to_track_Y(-(tf - t0))
-        m.vx = self.tracking.vx(-(tf - t0))
-        m.vy = self.tracking.vy(-(tf - t0))
-        m.psi = self.tracking.psi(-(tf - t0))
-        m.dpsi = self.tracking.dpsi(-(tf - t0))
-
-        sol = ModelSolver().simulate(m, t0, tf, self.time_step, error_space)
-        new_trajectories = sol.y
+        m = self.whatif_model(BikeDynamicModel, dict(zip(BIKE_DYNAMIC_STATES, self.whatif_state(t0, tf))))
+        m.Caf = lambda: new_caf
+        # Rewrite control input to mimic the past behavior.
+        m.deltaf = lambda: deltaf(m.time())
+
+        sol_y = self.simulate_whatif(m, t0, tf, error_space, deltaf=deltaf)
+        new_trajectories = sol_y
         if only_tracked_state:
             new_trajectories = np.array([
-                sol.y[self.X_idx, :],
-                sol.y[self.Y_idx, :]
+                sol_y[self.X_idx, :],
+                sol_y[self.Y_idx, :]
             ])
             assert len(new_trajectories) == 2
-            assert len(new_trajectories[0, :]) == len(sol.y[0, :])
+            assert len(new_trajectories[0, :]) == len(sol_y[0, :])
 
         return new_trajectories
 
+    def whatif_state(self, t0, tf):
+        # Initial state of the what-if simulations of the window [t0, tf], ordered as BIKE_DYNAMIC_STATES:
+        # the tracking model's, except for the tracked X and Y.
+        x0 = np.array([getattr(self.tracking, s)(-(tf - t0)) for s in BIKE_DYNAMIC_STATES])
+        x0[BIKE_DYNAMIC_STATES.index('X')] = self.to_track_X(-(tf - t0))
+        x0[BIKE_DYNAMIC_STATES.index('Y')] = self.to_track_Y(-(tf - t0))
+        return x0
+
+    def whatif_flat(self, t0, tf):
+        # Same what-if simulation as run_whatif_simulation.
+        return BikeDynamicWhatIf(self.tracking, self.whatif_state(t0, tf), self.past_signal(self, 'to_track_delta', t0, tf))
+
     def update_tracking_model(self, new_present_state, new_parameter):
         self.tracking.record_state(new_present_state, self.time(), override=True)
         self.tracking.Caf = lambda: new_parameter[0]
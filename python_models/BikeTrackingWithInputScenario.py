@@ -18,7 +18,11 @@ class BikeTrackingWithInputScenario(Model):
         self.to_track = BikeDynamicModelWithDriver()
         self.tracking = BikeTrackingWithInput()
 
-        self._rand_Caf = 800
+        # Caf of the bike being tracked steps from Caf_before to Caf_after at Caf_step_time.
+        self.Caf_before = 800
+        self.Caf_after = 500
+        self.Caf_step_time = 10.0
+        self._rand_Caf = self.Caf_before
 
         self.to_track.dbike.Caf = lambda: self._rand_Caf
 
@@ -29,7 +33,7 @@ class BikeTrackingWithInputScenario(Model):
         self.save()
 
     def update_Caf(self):
-        return 800 if self.time() < 10.0 else 500
+        return self.Caf_before if self.time() < self.Caf_step_time else self.Caf_after
 
     def discrete_step(self):
         super().discrete_step()
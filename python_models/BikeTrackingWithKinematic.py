@@ -6,9 +6,10 @@ from BikeKinematicModel import BikeKinematicModel
 from DriverDynamic import DriverDynamic
 from DriverKinematic import DriverKinematic
 from oomodelling.Model import Model
-from oomodelling.ModelSolver import ModelSolver
 from oomodelling.TrackingSimulator import TrackingSimulator
 
+from RecalibratingTrackingSimulator import RecalibratingTrackingSimulator
+
 
 class SystemToTrack(Model):
 
@@ -44,7 +45,7 @@ class TrackingModel(Model):
         self.save()
 
 
-class BikeTrackingSimulatorKinematic(TrackingSimulator):
+class BikeTrackingSimulatorKinematic(RecalibratingTrackingSimulator):
     def __init__(self):
         super().__init__()
 
@@ -60,27 +61,29 @@ class BikeTrackingSimulatorKinematic(TrackingSimulator):
 
     def run_whatif_simulation(self, new_parameters, t0, tf, tracked_solutions, error_space, only_tracked_state=True):
         delay, k = new_parameters
-        m = TrackingModel()
-        m.kdriver.delay = delay
-        m.kdriver.k = k
-        # Rewrite control input to mimic the past behavior.
-        m.control_steering = lambda d: self.to_track.steering(-(tf - m.time()))
         assert np.isclose(self.to_track.dbike.X(-(tf - t0)), tracked_solutions[0][0])
         assert np.isclose(self.to_track.dbike.Y(-(tf - t0)), tracked_solutions[1][0])
-        m.kbike.x = self.to_track.dbike.X(-(tf - t0))
-        m.kbike.y = self.to_track.dbike.Y(-(tf - t0))
-        m.kbike.v = self.to_track.dbike.vx(-(tf - t0))
-        m.kbike.psi = self.to_track.dbike.psi(-(tf - t0))
+        m = self.whatif_model(TrackingModel, {
+            'kdriver.delay': delay,
+            'kdriver.k': k,
+            'kbike.x': self.to_track.dbike.X(-(tf - t0)),
+            'kbike.y': self.to_track.dbike.Y(-(tf - t0)),
+            'kbike.v': self.to_track.dbike.vx(-(tf - t0)),
+            'kbike.psi': self.to_track.dbike.psi(-(tf - t0)),
+        })
+        # Rewrite control input to mimic the past behavior.
+        steering = self.past_signal(self.to_track, 'steering', t0, tf)
+        m.control_steering = lambda d: steering(m.time())
 
-        sol = ModelSolver().simulate(m, t0, tf, self.time_step, error_space)
-        new_trajectories = sol.y
+        sol_y = self.simulate_whatif(m, t0, tf, error_space)
+        new_trajectories = sol_y
         if only_tracked_state:
             new_trajectories = np.array([
-                sol.y[3, :],
-                sol.y[4, :]
+                sol_y[3, :],
+                sol_y[4, :]
             ])
             assert len(new_trajectories) == 2
-            assert len(new_trajectories[0, :]) == len(sol.y[0, :])
+            assert len(new_trajectories[0, :]) == len(sol_y[0, :])
 
         return new_trajectories
 
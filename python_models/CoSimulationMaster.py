@@ -0,0 +1,228 @@
+"""
+In-process co-simulation of the tracking scenario, as configured for the Maestro co-simulation engine, e.g.:
+    python CoSimulationMaster.py ../reproduce_package/TrackingSimulator.json --output results.csv
+The written CSV has the columns of the one written by the engine, so it can be plotted in the same way.
+Results can also be written as columnar binary results, e.g., --output results.cols, see ColumnarResults.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from BikeDynamicModel import BikeDynamicModel
+from BikeTrackingWithInput import BikeTrackingWithInput
+from ColumnarResults import ColumnarWriter
+from DriverDynamic import DriverDynamic
+from ModelStepper import ModelStepper
+from NelderMeadSearch import NelderMeadSearch
+
+
+class CoSimulationSlave:
+    """
+    A model stepped by CoSimulationMaster, in place of one FMU instance.
+    inputs maps each input port to the model attribute that reads it, which is given a function returning the
+    port's value. outputs maps each output port to a function returning its value after a step,
+    and start_values gives the outputs before the first step.
+    parameters are the model attributes that the configuration can set.
+    """
+
+    def __init__(self, model, inputs, outputs, start_values, parameters=()):
+        self.model = model
+        self.inputs = inputs
+        self.outputs = outputs
+        self.start_values = start_values
+        self.parameters = parameters
+        self.stepper = ModelStepper(model)
+
+    def set_parameter(self, name, value):
+        if name not in self.parameters:
+            raise ValueError("{} is not a parameter of {}.".format(name, type(self.model).__name__))
+        setattr(self.model, name, value)
+
+    def do_step(self, t, h):
+        self.stepper.step(t, h)
+        self.model.discrete_step()
+
+
+# Slaves with the models, inputs and outputs of the FMUs of the tracking scenario, by FMU name.
+
+def bicycle_driver():
+    m = DriverDynamic()
+    # Caf is not part of the driver model: the FMU drops it at 10s, as BikeTrackingWithInputScenario does.
+    outputs = {'deltaf': m.steering, 'Caf': lambda: 800.0 if m.time() < 10.0 else 500.0}
+    return CoSimulationSlave(m, {}, outputs, {'deltaf': 0.0, 'Caf': 800.0},
+                             ('width', 'amplitude', 'risingtime', 'starttime', 'nperiods'))
+
+
+def bicycle_dynamic():
+    m = BikeDynamicModel()
+    return CoSimulationSlave(m, {'Caf': 'Caf', 'deltaf': 'deltaf'}, {'X': m.X, 'Y': m.Y}, {'X': 0.0, 'Y': 0.0},
+                             ('lf', 'lr', 'm', 'Iz', 'Car'))
+
+
+# The fields of the last RecalibrationRecord that the BicycleTracking FMU outputs, as recalibration_<field>.
+RECALIBRATION_FIELDS = ('horizon', 'error', 'cost', 'iterations', 'whatif_simulations', 'rhs_evaluations',
+                        'wall_time')
+
+
+def recalibration_output(m, field):
+    # The field of the last recalibration of m, or zero before the first one.
+    return lambda: float(getattr(m.recalibration_history[-1], field)) if m.recalibration_history else 0.0
+
+
+def bicycle_tracking():
+    m = BikeTrackingWithInput()
+    # Nelder-Mead, as TrackingSimulator, but accepting the best point at max_iterations (see NelderMeadSearch),
+    # and recording each recalibration, as the FMU does.
+    m.recalibration_search = NelderMeadSearch()
+    m.tolerance = 0.2
+    m.horizon = 5.0
+    m.cooldown = 5.0
+    m.nsamples = 10
+    m.max_iterations = 20
+    m.time_step = 0.1
+    m.conv_xatol = 1e3
+    m.conv_fatol = 0.01
+    # Caf is read through m.tracking, as recalibrations replace it.
+    outputs = {'X': m.tracking.X, 'Y': m.tracking.Y, 'tolerance': lambda: m.tolerance, 'error': m.error,
+               'Caf': lambda: m.tracking.Caf()}
+    start_values = {'X': 0.0, 'Y': 0.0, 'tolerance': m.tolerance, 'error': 0.0, 'Caf': 800.0}
+    outputs['recalibrations'] = lambda: float(len(m.recalibration_history))
+    start_values['recalibrations'] = 0.0
+    for field in RECALIBRATION_FIELDS:
+        outputs['recalibration_' + field] = recalibration_output(m, field)
+        start_values['recalibration_' + field] = 0.0
+    inputs = {'to_track_X': 'to_track_X', 'to_track_Y': 'to_track_Y', 'deltaf': 'to_track_delta'}
+    return CoSimulationSlave(m, inputs, outputs, start_values,
+                             ('tolerance', 'horizon', 'cooldown', 'nsamples', 'max_iterations', 'time_step',
+                              'conv_xatol', 'conv_fatol'))
+
+
+SLAVES = {
+    'BicycleDriver': bicycle_driver,
+    'BicycleDynamic': bicycle_dynamic,
+    'BicycleTracking': bicycle_tracking,
+}
+
+
+def split_variable(name):
+    # '{bd}.bdi.X' -> ('{bd}.bdi', 'X')
+    instance, port = name.rsplit('.', 1)
+    return instance, port
+
+
+class CoSimulationMaster:
+    """
+    Fixed-step co-simulation of the slaves of a configuration in the JSON format of the Maestro co-simulation engine,
+    e.g., reproduce_package/TrackingSimulator.json, without the engine nor the FMUs.
+    The FMU of each instance is recognized by the name of its file, e.g., BicycleTracking.fmu, and replaced by the
+    slave that SLAVES has under that name.
+    All output values are kept in a single array, which the connected inputs read in place, so no values are copied
+    between slaves. As in the engine, all slaves step from the same time, with the inputs they had at its start.
+    """
+
+    def __init__(self, config, slaves=SLAVES):
+        algorithm = config['algorithm']
+        if algorithm['type'] != 'fixed-step':
+            raise ValueError("Only fixed-step co-simulation is supported, not {}.".format(algorithm['type']))
+        self.step_size = algorithm['size']
+
+        instances = set(split_variable(source)[0] for source in config['connections'])
+        for targets in config['connections'].values():
+            instances.update(split_variable(target)[0] for target in targets)
+        instances.update(config.get('logVariables', {}).keys())
+        self.slaves = {}
+        for instance in sorted(instances):
+            fmu = config['fmus'][instance.split('.')[0]]
+            name = fmu.replace('\\', '/').rstrip('/').rsplit('/', 1)[-1]
+            if name.endswith('.fmu'):
+                name = name[:-len('.fmu')]
+            if name not in slaves:
+                raise ValueError("No slave for the FMU {} of {}.".format(name, instance))
+            self.slaves[instance] = slaves[name]()
+
+        # One value per output of every slave.
+        self.variables = ['{}.{}'.format(instance, port)
+                          for instance, slave in self.slaves.items() for port in slave.outputs]
+        index = {name: i for i, name in enumerate(self.variables)}
+        self.values = np.array([slave.start_values[port]
+                                for slave in self.slaves.values() for port in slave.outputs], dtype=float)
+        self._outputs = [(index['{}.{}'.format(instance, port)], f)
+                         for instance, slave in self.slaves.items() for port, f in slave.outputs.items()]
+
+        for source, targets in config['connections'].items():
+            for target in targets:
+                instance, port = split_variable(target)
+                self.connect(self.slaves[instance], port, index[source])
+
+        for name, value in config.get('parameters', {}).items():
+            instance, port = split_variable(name)
+            self.slaves[instance].set_parameter(port, value)
+
+        # The columns of the results: the connected outputs, and the logged ones, as the engine writes them.
+        logged = list(config['connections'].keys())
+        for instance, ports in config.get('logVariables', {}).items():
+            logged += ['{}.{}'.format(instance, port) for port in ports if '{}.{}'.format(instance, port) not in logged]
+        self.logged = logged
+        self._logged_idx = [index[name] for name in logged]
+
+    @staticmethod
+    def from_file(path):
+        with open(path) as f:
+            return CoSimulationMaster(json.load(f))
+
+    def connect(self, slave, port, i):
+        values = self.values
+        setattr(slave.model, slave.inputs[port], lambda: values[i])
+
+    def columns(self):
+        return ['time'] + self.logged
+
+    def simulate(self, start_time, stop_time, writer=None):
+        # Returns the results as a dictionary from column name, 'time' and each logged variable, to its values.
+        # When writer is given, e.g., a ColumnarWriter, each row of results is appended to it as soon as it is
+        # computed, in the order of columns(), and nothing is returned.
+        h = self.step_size
+        nsteps = int(round((stop_time - start_time) / h))
+        results = np.empty((nsteps + 1 if writer is None else 1, len(self.logged) + 1))
+        row = results[0]
+        for k in range(nsteps + 1):
+            t = start_time + k*h
+            if k > 0:
+                for slave in self.slaves.values():
+                    slave.do_step(t - h, h)
+                for i, f in self._outputs:
+                    self.values[i] = f()
+            if writer is None:
+                row = results[k]
+            row[0] = t
+            row[1:] = self.values[self._logged_idx]
+            if writer is not None:
+                writer.append(row)
+        if writer is None:
+            return dict(zip(self.columns(), results.T))
+
+
+def write_csv(columns, path):
+    names = list(columns.keys())
+    np.savetxt(path, np.column_stack([columns[name] for name in names]), delimiter=',', header=','.join(names),
+               comments='')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process co-simulation of a co-simulation engine configuration.")
+    parser.add_argument("config", help="JSON configuration of the co-simulation, e.g., TrackingSimulator.json.")
+    parser.add_argument("--start-time", type=float, default=0.0)
+    parser.add_argument("--stop-time", type=float, default=25.0)
+    parser.add_argument("--output", default="results.csv",
+                        help="CSV file where the results are written, or, if it ends in .cols, columnar results "
+                             "directory, which is written while simulating (see ColumnarResults).")
+    args = parser.parse_args()
+
+    master = CoSimulationMaster.from_file(args.config)
+    if args.output.endswith('.cols'):
+        with ColumnarWriter(args.output, master.columns()) as writer:
+            master.simulate(args.start_time, args.stop_time, writer)
+    else:
+        write_csv(master.simulate(args.start_time, args.stop_time), args.output)
+    print("Results written to {}.".format(args.output))
@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+
+# Columnar results are a directory, e.g., results.cols, with columns.json, which has the column names in order,
+# and one file per column, named by its position, e.g., 0.f64, with its values as raw little-endian float64.
+COLUMNS_FILE = 'columns.json'
+DTYPE = np.dtype('<f8')
+
+
+def column_file(path, i):
+    return os.path.join(path, '{}.f64'.format(i))
+
+
+class ColumnarWriter:
+    """
+    Writes rows of results to a columnar results directory, appending to each column file as they come.
+    Rows are buffered, and written every chunk_rows rows, on flush, and on close.
+    Can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, path, names, chunk_rows=1024):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, COLUMNS_FILE), 'w') as f:
+            json.dump({'names': list(names)}, f)
+        self._files = [open(column_file(path, i), 'wb') for i in range(len(names))]
+        self._buffer = np.empty((chunk_rows, len(names)), dtype=DTYPE)
+        self._rows = 0
+
+    def append(self, row):
+        self._buffer[self._rows] = row
+        self._rows += 1
+        if self._rows == len(self._buffer):
+            self.flush()
+
+    def append_rows(self, rows):
+        # Writes a 2D array of rows, after the buffered ones.
+        self.flush()
+        self._write(np.asarray(rows, dtype=DTYPE))
+
+    def flush(self):
+        self._write(self._buffer[:self._rows])
+        self._rows = 0
+
+    def _write(self, rows):
+        for f, column in zip(self._files, rows.T):
+            f.write(column.tobytes())
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_columns(path):
+    # Returns the columns of a columnar results directory, as a dictionary from column name to its values,
+    # memory-mapped and read-only, so only the parts that are used are read.
+    # Columns are cut to the same length, in case the results are still being written.
+    with open(os.path.join(path, COLUMNS_FILE)) as f:
+        names = json.load(f)['names']
+    nrows = min(os.path.getsize(column_file(path, i)) // DTYPE.itemsize for i in range(len(names)))
+    if nrows == 0:
+        return {name: np.empty(0, dtype=DTYPE) for name in names}
+    return {name: np.memmap(column_file(path, i), dtype=DTYPE, mode='r', shape=(nrows,))
+            for i, name in enumerate(names)}
+
+
+def write_columns(columns, path):
+    # Writes a dictionary from column name to values, e.g., as returned by CoSimulationMaster.simulate.
+    names = list(columns.keys())
+    with ColumnarWriter(path, names) as writer:
+        writer.append_rows(np.column_stack([columns[name] for name in names]))
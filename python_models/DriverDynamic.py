@@ -1,5 +1,8 @@
 from oomodelling.Model import Model
 
+from DriverProfiles import trapezoid_profile
+
+
 class DriverDynamic(Model):
 
     def __init__(self):
@@ -9,31 +12,22 @@ class DriverDynamic(Model):
         self.risingtime = self.parameter(3.0)
         self.starttime = self.parameter(3.0)
         self.steering = self.var(self.get_steering)
-        self.last_period_endtime = 0
         self.nperiods = self.parameter(2)
-        self.nperiods_counter = 0
+        self._profile = None
+        self._profile_parameters = None
         self.save()
 
-    def get_steering(self):
-        if self.nperiods_counter >= self.nperiods:
-            return 0.0
-
-        t = self.time() - self.last_period_endtime
-        if t < self.starttime:
-            return 0.0
-        elif (t - self.starttime) < self.risingtime:
-            # rising
-            return self.amplitude * (t - self.starttime) / self.risingtime
-        elif (t - self.starttime - self.risingtime) < self.width:
-            # plateau
-            return self.amplitude
-        else:
-            # falling
-            res = self.amplitude - self.amplitude * (t - self.starttime - self.risingtime - self.width) / self.risingtime
-            if res <= 0.0:
-                # New period ended
-                self.last_period_endtime = self.time()
-                self.nperiods_counter += 1
-            return max(0.0, res)
+    def profile(self):
+        # The steering as a pure function of time, with the parameters as they are now.
+        # Each period starts right after the previous one ended, starting with a wait of starttime.
+        parameters = (self.amplitude, self.starttime, self.risingtime, self.width, self.nperiods)
+        if parameters != self._profile_parameters:
+            self._profile = trapezoid_profile(*parameters)
+            self._profile_parameters = parameters
+        return self._profile
 
+    def breakpoints(self):
+        return self.profile().breakpoints
 
+    def get_steering(self):
+        return float(self.profile()(self.time()))
@@ -1,5 +1,8 @@
+import numpy as np
 from oomodelling.Model import Model
 
+from SignalHistory import past_value
+
 
 class DriverKinematic(Model):
 
@@ -8,7 +11,12 @@ class DriverKinematic(Model):
         self.delay = self.parameter(0.3)
         self.k = self.parameter(0.9)
         self.u = self.input(lambda: 0.0)
-        self.steering = self.var(lambda: self.k*self.u(- self.delay))
+        self.steering = self.var(lambda: self.k*self.delayed_u())
         self.save()
 
+    def delayed_u(self):
+        # u(-delay), with the recorded sample found by binary search instead of the linear scan of Model.
+        if np.isclose(self.delay, 0.0) or len(self.signals['u']) == 0:
+            return self.u()
+        return past_value(self, 'u', self.time() - self.delay)
 
@@ -0,0 +1,47 @@
+import numpy as np
+
+# Steering profiles are pure functions of time, which accept a time or an array of times,
+# and list the times where they are not smooth in breakpoints, so that solvers can stop there instead of
+# shrinking their steps around them (see ModelStepper, BatchSolver and fixed_step_solve).
+
+
+class PiecewiseLinearProfile:
+    # Linear between the points (times, values), and constant before and after them.
+    def __init__(self, times, values):
+        self.times = np.asarray(times, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.breakpoints = self.times
+
+    def __call__(self, t):
+        return np.interp(t, self.times, self.values)
+
+
+class SineProfile:
+    def __init__(self, amplitude, frequency):
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.breakpoints = np.empty(0)
+
+    def __call__(self, t):
+        return self.amplitude * np.sin(self.frequency * np.asarray(t))
+
+
+def trapezoid_profile(amplitude, starttime, risingtime, width, nperiods):
+    # nperiods periods of: zero for starttime, rising to amplitude in risingtime, plateau for width,
+    # and falling back to zero in risingtime. Zero afterwards.
+    period = starttime + 2*risingtime + width
+    times = []
+    values = []
+    for k in range(int(nperiods)):
+        start = k*period + starttime
+        times += [start, start + risingtime, start + risingtime + width, start + 2*risingtime + width]
+        values += [0.0, amplitude, amplitude, 0.0]
+    if not times:
+        return PiecewiseLinearProfile([0.0], [0.0])
+    return PiecewiseLinearProfile(times, values)
+
+
+def profile_breakpoints(*inputs):
+    # Sorted breakpoints of all the given inputs that are profiles. Other inputs are ignored.
+    breakpoints = [getattr(f, 'breakpoints', ()) for f in inputs]
+    return np.unique(np.concatenate([np.empty(0)] + [np.asarray(b, dtype=float) for b in breakpoints]))
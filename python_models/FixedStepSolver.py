@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def rk4_step(f, t, x, h):
+    k1 = f(t, x)
+    k2 = f(t + h/2, x + (h/2)*k1)
+    k3 = f(t + h/2, x + (h/2)*k2)
+    k4 = f(t + h, x + h*k3)
+    return x + (h/6)*(k1 + 2*k2 + 2*k3 + k4)
+
+
+def heun_step(f, t, x, h):
+    k1 = f(t, x)
+    k2 = f(t + h, x + h*k1)
+    return x + (h/2)*(k1 + k2)
+
+
+# Explicit fixed-step methods, with no error control nor dense output.
+# They can be used wherever a solve_ivp method name is accepted for what-if simulations, and in ModelStepper.
+FIXED_STEP_METHODS = {'RK4': rk4_step, 'Heun': heun_step}
+
+# Extent of the stability region of each method along the negative real axis:
+# steps are stable only while h*|lambda| stays below it, for every eigenvalue lambda of the Jacobian of f.
+STABILITY_LIMITS = {'RK4': 2.785, 'Heun': 2.0}
+
+
+def spectral_radius(f, t, x, iterations=10):
+    # Estimate of the largest |lambda| of the Jacobian of f at (t, x), by power iteration
+    # on finite differences of f, so with iterations + 1 evaluations of f and no Jacobian.
+    x = np.asarray(x, dtype=float)
+    fx = f(t, x)
+    v = np.linspace(1.0, 2.0, x.size).reshape(x.shape)
+    v /= np.linalg.norm(v)
+    eps = 1e-7 * (1.0 + np.linalg.norm(x))
+    rho = 0.0
+    for _ in range(iterations):
+        w = (f(t, x + eps*v) - fx) / eps
+        rho = np.linalg.norm(w)
+        if not rho > 0.0:
+            return 0.0
+        v = w / rho
+    return rho
+
+
+def stable_step(method, f, t, x, h, safety=0.9):
+    # Largest step of at most h for which method is stable at (t, x), as estimated by spectral_radius.
+    # Stiff models need much smaller steps than their inputs do, e.g., the yaw rate of BikeDynamicModel with
+    # its default Iz = 1 has an eigenvalue near -6.8e3, so RK4 needs steps below 4e-4.
+    # The estimate is local: a model whose stiffness grows over a simulation can still diverge,
+    # which fixed_step_solve reports. Stiff models are better simulated with an implicit method, e.g., 'BDF'.
+    rho = spectral_radius(f, t, x)
+    if rho * h <= safety * STABILITY_LIMITS[method]:
+        return h
+    return safety * STABILITY_LIMITS[method] / rho
+
+
+def fixed_step_solve(method, f, t0, x0, t_eval, h, breakpoints=(), max_stable_step=None):
+    # States at the times t_eval, with shape x0.shape + (len(t_eval),).
+    # Between consecutive output times, takes equal steps of at most h, so that every output time is hit exactly.
+    # The steps are also at most max_stable_step, the step for which the model is stable (see stable_step),
+    # which is estimated once, at (t0, x0), when it is None.
+    # The breakpoints, e.g., of a steering profile, are hit exactly as well, so that no step crosses them.
+    step = FIXED_STEP_METHODS[method]
+    t_eval = np.asarray(t_eval, dtype=float)
+    stops = t_eval
+    breakpoints = np.asarray(breakpoints, dtype=float)
+    if len(t_eval) > 0 and len(breakpoints) > 0:
+        stops = np.union1d(t_eval, breakpoints[(breakpoints > t0) & (breakpoints < t_eval[-1])])
+    ys = np.empty(np.shape(x0) + (len(stops),))
+    t, x = t0, np.asarray(x0, dtype=float)
+    if max_stable_step is None:
+        max_stable_step = stable_step(method, f, t, x, h)
+    h = min(h, max_stable_step)
+    for i, t_out in enumerate(stops):
+        n = int(np.ceil((t_out - t) / h - 1e-9))
+        if n > 0:
+            dt = (t_out - t) / n
+            for k in range(n):
+                x = step(f, t + k*dt, x, dt)
+            if not np.all(np.isfinite(x)):
+                raise FloatingPointError("The {} steps of {} diverged between {} and {}: the model is too stiff "
+                                         "for them (see stable_step).".format(method, dt, t, t_out))
+            t = t_out
+        ys[..., i] = x
+    return ys if stops is t_eval else ys[..., np.searchsorted(stops, t_eval)]
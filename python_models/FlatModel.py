@@ -0,0 +1,37 @@
+import numpy as np
+from oomodelling.Model import Model
+
+
+def held(value):
+    # Input that keeps the given value, as it does over a co-simulation step.
+    return lambda t: value
+
+
+def flat_derivatives(model, state_names, rhs):
+    # Wraps rhs(t, s), where s is ordered as state_names, into f(t, x), where x is ordered as model.state_vector().
+    # The time state of the model, which rhs does not know about, has derivative 1.
+    idx = np.array([model.get_state_idx(name) for name in state_names])
+    time_idx = model.get_state_idx(Model.TIME)
+    n = len(model.state_vector())
+
+    def f(t, x):
+        dx = np.zeros(n)
+        dx[idx] = rhs(t, x[idx])
+        dx[time_idx] = 1.0
+        return dx
+
+    return f
+
+
+def flat_jacobian(model, state_names, jac):
+    # Same as flat_derivatives, for a Jacobian jac(t, s) of the derivatives with respect to the states.
+    idx = np.array([model.get_state_idx(name) for name in state_names])
+    block = np.ix_(idx, idx)
+    n = len(model.state_vector())
+
+    def f(t, x):
+        J = np.zeros((n, n))
+        J[block] = jac(t, x[idx])
+        return J
+
+    return f
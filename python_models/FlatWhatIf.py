@@ -0,0 +1,186 @@
+import numpy as np
+
+from BatchSolver import BatchSolver
+from DriverProfiles import profile_breakpoints
+from FixedStepSolver import FIXED_STEP_METHODS, stable_step
+from SensitivitySolver import SensitivitySolver
+from BikeDynamicModel import BIKE_DYNAMIC_STATES, bike_dynamic_derivatives, bike_dynamic_jacobian, \
+    bike_dynamic_jacobian_caf
+from BikeDynamicModelSpeedDriven import BIKE_SPEED_DRIVEN_STATES, bike_speed_driven_derivatives, \
+    bike_speed_driven_jacobian, bike_speed_driven_jacobian_caf
+from RobottiDynamicModel import ROBOTTI_STATES, robotti_parameters, robotti_derivatives, robotti_jacobian, \
+    robotti_jacobian_caf
+
+
+class FlatWhatIf:
+    """
+    What-if simulation of a tracking simulator, in terms of the flat equations of its what-if model.
+    Subclasses implement, for the time t, the state array s, ordered as state_names,
+    and the parameters p being recalibrated:
+    derivatives(t, s, p), the derivatives of s, which must also accept a batch of states and parameters,
+    one per column,
+    jacobian(t, s, p), their Jacobian with respect to s, and
+    parameter_jacobian(t, s, p), their Jacobian with respect to p, with shape (nstates, nparameters).
+    x0 is the initial state of the what-if simulation, and tracked_states the names of the states matched against
+    the tracked signals, in the same order.
+    breakpoints are the times where the inputs are not smooth, e.g., where a WindowInterpolant changes value,
+    which subclasses set from their inputs, and where the solvers stop.
+    inputs are the time-varying inputs, as functions of time, which subclasses set as well.
+    Instances only hold numbers and recorded inputs, so they can be sent to worker processes.
+    """
+
+    def __init__(self, state_names, x0, tracked_states):
+        self.state_names = state_names
+        self.x0 = x0
+        self.tracked_idx = [state_names.index(name) for name in tracked_states]
+        self.breakpoints = np.empty(0)
+        self.inputs = ()
+        # Evaluations of the derivatives in the simulations of this what-if, where a batch evaluation counts once.
+        self.nfev = 0
+
+    # noinspection PyUnreachableCode
+    def derivatives(self, t, s, p):
+        assert False, "For subclasses"
+        return s
+
+    # noinspection PyUnreachableCode
+    def jacobian(self, t, s, p):
+        assert False, "For subclasses"
+        return np.zeros((len(s), len(s)))
+
+    # noinspection PyUnreachableCode
+    def parameter_jacobian(self, t, s, p):
+        assert False, "For subclasses"
+        return np.zeros((len(s), len(p)))
+
+    def simulate_batch(self, candidates, t0, tf, h, t_eval, method='RK45'):
+        # Tracked trajectories of each candidate, with shape (ncandidates, nsignals, len(t_eval)).
+        ps = candidates.T
+
+        def f(t, s):
+            self.nfev += 1
+            return self.derivatives(t, s, ps)
+
+        ys = BatchSolver(method).simulate(f, np.tile(self.x0[:, None], (1, len(candidates))), t0, tf, h, t_eval,
+                                          self.breakpoints)
+        return ys[self.tracked_idx].transpose(1, 0, 2)
+
+    def simulate_costs(self, candidates, t0, tf, h, t_eval, tracked_solutions, bound, method='RK45'):
+        # Costs of each candidate, as trajectory_cost of simulate_batch, but accumulated sample by sample,
+        # abandoning candidates as soon as their cost exceeds bound.
+        # The cost of an abandoned candidate is its cost up to then, which is above bound, but below its full cost.
+        # The costs of the others are those of simulate_batch, as they are integrated the same way:
+        # solve_ivp methods integrate the whole batch once, as their error control would pick other steps for
+        # a smaller batch, and stop once all candidates are abandoned (see BatchSolver.samples).
+        # Fixed-step methods drop the abandoned candidates from the batch, which leaves the steps of the others
+        # as they are, given the stable step of the whole batch at t0, which simulate_batch estimates as well.
+        target = np.asarray(tracked_solutions)
+        solver = BatchSolver(method)
+        costs = np.zeros(len(candidates))
+        alive = np.arange(len(candidates))
+        s = np.tile(self.x0[:, None], (1, len(candidates)))
+
+        def batch(t, s):
+            self.nfev += 1
+            return self.derivatives(t, s, candidates.T)
+
+        if method not in FIXED_STEP_METHODS:
+            for k, s in enumerate(solver.samples(batch, s, t0, tf, h, t_eval, self.breakpoints)):
+                costs[alive] += ((s[self.tracked_idx][:, alive] - target[:, k, None])**2).sum(axis=0)
+                alive = alive[costs[alive] <= bound]
+                if len(alive) == 0:
+                    break
+            return costs
+        t = t0
+        max_stable_step = stable_step(method, batch, t0, s, h)
+        for k, t_k in enumerate(t_eval):
+            if t_k > t:
+                ps = candidates[alive].T
+
+                def f(t, s):
+                    self.nfev += 1
+                    return self.derivatives(t, s, ps)
+
+                s = solver.simulate(f, s, t, t_k, h, [t_k], self.breakpoints, max_stable_step)[:, :, -1]
+                t = t_k
+            costs[alive] += ((s[self.tracked_idx] - target[:, k, None])**2).sum(axis=0)
+            below = costs[alive] <= bound
+            alive, s = alive[below], s[:, below]
+            if len(alive) == 0:
+                break
+        return costs
+
+    def simulate_sensitivity(self, p, t0, tf, h, t_eval):
+        # Tracked trajectories of the parameters p, and their sensitivities to p,
+        # with shapes (nsignals, len(t_eval)) and (nsignals, nparameters, len(t_eval)).
+        solver = SensitivitySolver()
+        ys, sensitivities = solver.simulate(self, p, t0, tf, h, t_eval)
+        self.nfev += solver.nfev
+        return ys[self.tracked_idx], sensitivities[self.tracked_idx]
+
+
+# What-if simulations recalibrating Caf, the front tyre cornering stiffness.
+# The parameters are taken from the given model, the inputs are functions of time, and x0 is ordered as the model's states.
+
+class BikeDynamicWhatIf(FlatWhatIf):
+    def __init__(self, b, x0, deltaf):
+        super().__init__(BIKE_DYNAMIC_STATES, x0, ('X', 'Y'))
+        self.deltaf = deltaf
+        self.inputs = (deltaf,)
+        self.breakpoints = profile_breakpoints(deltaf)
+        self.lf, self.lr, self.m, self.Iz, self.Car = b.lf, b.lr, b.m, b.Iz, b.Car
+
+    def derivatives(self, t, s, p):
+        return bike_dynamic_derivatives(s, p[0], self.deltaf(t), 0.0, self.lf, self.lr, self.m, self.Iz, self.Car)
+
+    def jacobian(self, t, s, p):
+        return bike_dynamic_jacobian(s, p[0], self.deltaf(t), self.lf, self.lr, self.m, self.Iz, self.Car)
+
+    def parameter_jacobian(self, t, s, p):
+        return bike_dynamic_jacobian_caf(s, self.deltaf(t), self.lf, self.m, self.Iz)[:, None]
+
+
+class BikeSpeedDrivenWhatIf(FlatWhatIf):
+    def __init__(self, b, x0, deltaf, vx):
+        super().__init__(BIKE_SPEED_DRIVEN_STATES, x0, ('X', 'Y'))
+        self.deltaf = deltaf
+        self.vx = vx
+        self.inputs = (deltaf, vx)
+        self.breakpoints = profile_breakpoints(deltaf, vx)
+        self.lf, self.lr, self.m, self.Iz, self.Car = b.lf, b.lr, b.m, b.Iz, b.Car
+
+    def derivatives(self, t, s, p):
+        return bike_speed_driven_derivatives(s, p[0], self.deltaf(t), self.vx(t),
+                                             self.lf, self.lr, self.m, self.Iz, self.Car)
+
+    def jacobian(self, t, s, p):
+        return bike_speed_driven_jacobian(s, p[0], self.deltaf(t), self.vx(t),
+                                          self.lf, self.lr, self.m, self.Iz, self.Car)
+
+    def parameter_jacobian(self, t, s, p):
+        return bike_speed_driven_jacobian_caf(s, self.deltaf(t), self.vx(t), self.lf, self.m, self.Iz)[:, None]
+
+
+class RobottiWhatIf(FlatWhatIf):
+    # The rear wheels do not steer, and the wheel speeds are kept as in r.
+    def __init__(self, r, x0, deltaFl, deltaFr):
+        super().__init__(ROBOTTI_STATES, x0, ('X', 'Y'))
+        self.deltaFl = deltaFl
+        self.deltaFr = deltaFr
+        self.inputs = (deltaFl, deltaFr)
+        self.breakpoints = profile_breakpoints(deltaFl, deltaFr)
+        self.vel_left, self.vel_right = r.vel_left(), r.vel_right()
+        self.rp = robotti_parameters(r)
+
+    def derivatives(self, t, s, p):
+        return robotti_derivatives(s, p[0], self.deltaFl(t), self.deltaFr(t), 0.0, 0.0,
+                                   self.vel_left, self.vel_right, *self.rp)
+
+    def jacobian(self, t, s, p):
+        return robotti_jacobian(s, p[0], self.deltaFl(t), self.deltaFr(t), 0.0, 0.0,
+                                self.vel_left, self.vel_right, *self.rp)
+
+    def parameter_jacobian(self, t, s, p):
+        T, Car, mu, m, Iz, lf, lr, Nlfl, Nlfr, Nlrl, Nlrr, wheel_radius, Cs, SC = self.rp
+        return robotti_jacobian_caf(s, p[0], self.deltaFl(t), self.deltaFr(t), self.vel_left, self.vel_right,
+                                    T, mu, m, Iz, lf, Nlfl, Nlfr, wheel_radius, SC)[:, None]
@@ -0,0 +1,94 @@
+"""
+Copies the modules of python_models that the packaged FMUs use into their resources/thirdparty,
+where the slaves import them from, e.g., "from thirdparty.ModelStepper import ModelStepper".
+The modules bundled in an FMU are those its slave imports from thirdparty, and those they import, in turn,
+from python_models. Their imports of each other are rewritten to go through thirdparty, and nothing else changes,
+so the bundles must be rebuilt whenever those modules change:
+    python FmuBundles.py
+"""
+import os
+import re
+import time
+import zipfile
+
+SOURCES = os.path.dirname(os.path.abspath(__file__))
+FMUS = os.path.join(SOURCES, '..', 'reproduce_package', 'fmus')
+# The FMUs whose slaves import modules of python_models.
+BUNDLED_FMUS = ['BicycleDriver.fmu', 'BicycleTracking.fmu']
+THIRDPARTY = 'resources/thirdparty/'
+
+_IMPORT = re.compile(r'^([ \t]*from\s+)(?P<name>\w+)(\s+import\b)', re.MULTILINE)
+_THIRDPARTY_IMPORT = re.compile(r'^[ \t]*from\s+thirdparty\.(?P<name>\w+)\s+import\b', re.MULTILINE)
+
+
+def source(name):
+    with open(os.path.join(SOURCES, name + '.py'), newline='') as f:
+        return f.read()
+
+
+def local_imports(text, pattern=_IMPORT):
+    # Names of the modules of python_models that text imports with pattern.
+    names = {m.group('name') for m in pattern.finditer(text)}
+    return {name for name in names if os.path.isfile(os.path.join(SOURCES, name + '.py'))}
+
+
+def bundled_modules(slave):
+    # Modules of python_models that the slave source imports from thirdparty, directly or not.
+    pending = local_imports(slave, _THIRDPARTY_IMPORT)
+    modules = set()
+    while pending:
+        name = pending.pop()
+        modules.add(name)
+        pending |= local_imports(source(name)) - modules
+    return sorted(modules)
+
+
+def rewrite(text, modules):
+    # text with its imports of the given modules going through thirdparty.
+    def thirdparty(m):
+        return m.group(1) + 'thirdparty.' + m.group('name') + m.group(3) if m.group('name') in modules else m.group(0)
+    return _IMPORT.sub(thirdparty, text)
+
+
+def slave_source(fmu):
+    # The source of the slave of fmu, resources/<model>.py, next to resources/thirdparty.
+    with zipfile.ZipFile(fmu) as z:
+        names = [n for n in z.namelist() if re.fullmatch(r'resources/\w+\.py', n) and n != 'resources/__init__.py']
+        return z.read(names[0]).decode()
+
+
+def expected_bundle(fmu):
+    # Contents of resources/thirdparty/<module>.py that fmu must have, by file name.
+    modules = bundled_modules(slave_source(fmu))
+    return {THIRDPARTY + name + '.py': rewrite(source(name), modules) for name in modules}
+
+
+def build(fmu):
+    # Rewrites fmu with the bundled modules as they are now in python_models.
+    # Previously bundled modules and compiled files are dropped, and the rest of the FMU is kept as it is.
+    bundle = expected_bundle(fmu)
+    with zipfile.ZipFile(fmu) as z:
+        kept = [(info, z.read(info)) for info in z.infolist()
+                if '__pycache__/' not in info.filename
+                and not (info.filename.startswith(THIRDPARTY) and info.filename.endswith('.py')
+                         and info.filename != THIRDPARTY + '__init__.py')]
+    now = time.localtime()[:6]
+    with zipfile.ZipFile(fmu, 'w', zipfile.ZIP_DEFLATED) as z:
+        for info, data in kept:
+            z.writestr(info, data)
+        for name, text in sorted(bundle.items()):
+            z.writestr(zipfile.ZipInfo(name, date_time=now), text.encode(), compress_type=zipfile.ZIP_DEFLATED)
+
+
+def stale_files(fmu):
+    # Names of the bundled modules of fmu that differ from python_models, or are missing.
+    bundle = expected_bundle(fmu)
+    with zipfile.ZipFile(fmu) as z:
+        names = set(z.namelist())
+        return sorted(name for name, text in bundle.items() if name not in names or z.read(name).decode() != text)
+
+
+if __name__ == "__main__":
+    for name in BUNDLED_FMUS:
+        build(os.path.join(FMUS, name))
+        print("Rebuilt the bundled modules of {}.".format(name))
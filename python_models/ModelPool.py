@@ -0,0 +1,34 @@
+class ModelPool:
+    """
+    Instances of a model, built by factory, e.g., BikeDynamicModel, that are reset and reused,
+    instead of being constructed for each what-if simulation.
+    Constructing a model declares all its parameters, states and equations again, which costs several times
+    more than resetting one (see Model.reset), which clears its signals and restores the initial states.
+    Parameters and inputs keep the last value they were given, so every use should give all those that vary.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.created = 0
+        self._free = []
+
+    def get(self, values=()):
+        # A reset model, with the given values, a dict from names to values, assigned in order.
+        # Names can be states, parameters or inputs, also of submodels, e.g., 'kdriver.delay'.
+        if self._free:
+            m = self._free.pop()
+            m.reset()
+        else:
+            m = self.factory()
+            self.created += 1
+        for name, value in dict(values).items():
+            *submodels, attribute = name.split('.')
+            model = m
+            for submodel in submodels:
+                model = getattr(model, submodel)
+            setattr(model, attribute, value)
+        return m
+
+    def put(self, m):
+        # Gives back a model obtained from get, once it is no longer used.
+        self._free.append(m)
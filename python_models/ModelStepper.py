@@ -0,0 +1,118 @@
+import logging
+
+import numpy as np
+from scipy.integrate import BDF, LSODA, RK45, Radau
+
+from FixedStepSolver import FIXED_STEP_METHODS, fixed_step_solve, stable_step
+
+
+def resume(solver, t_bound):
+    # Makes a solve_ivp solver (an OdeSolver) that reached its bound continue up to t_bound.
+    # scipy has no public way of doing this, so it sets the private t_bound and status of the solver.
+    # The derivative at the current point, f, which FSAL methods such as RK45 reuse as the first stage of their next
+    # step, is evaluated again, as inputs held constant over the previous step, e.g., deltaf, may have changed since.
+    solver.t_bound = t_bound
+    solver.status = 'running'
+    solver.f = solver.fun(solver.t, solver.y)
+
+
+def uses_jacobian(method):
+    # Whether method, an OdeSolver class or a partial of one, e.g., partial(BDF, rtol=1e-6), takes a jac.
+    method = getattr(method, 'func', method)
+    return isinstance(method, type) and issubclass(method, (BDF, LSODA, Radau))
+
+
+class ModelStepper:
+    """
+    Advances a model over consecutive communication steps, as the do_step of an FMU does,
+    keeping a single integrator alive across steps instead of creating a new solve_ivp at each step
+    (see resume). Only the step size it reached is kept: the derivative it starts each step from is evaluated anew.
+    The integrator is restarted only when the model's state no longer matches it, e.g.,
+    after a discrete step overrode the state with record_state(..., override=True), or when the step does not
+    start where the previous one ended.
+    method can also be one of FIXED_STEP_METHODS, e.g., 'RK4', which advances the state directly,
+    in steps of at most max_step (by default, a single step per communication step), shortened where the model
+    is too stiff for them (see stable_step). The stable step is estimated when the integrator restarts.
+    A stiff model, e.g., BikeDynamicModel with its default Iz, then takes many small steps,
+    and is better stepped with an implicit method, e.g., BDF.
+    Implicit methods, e.g., BDF, are given the analytic Jacobian of models that have a compile_jacobian,
+    e.g., BikeDynamicModel, and otherwise estimate it by finite differences.
+    When breakpoints are given, e.g., DriverDynamic.breakpoints(), the integrator stops exactly at those inside a step,
+    so that no integration step crosses a kink of the inputs.
+    When logger is set, a StepLogger, each step is traced, and integrator restarts are logged at the DEBUG level.
+    When sink is set, a SignalSink, its after_step is called once the state reached is recorded.
+    Typical use in do_step:
+        stepper.step(current_time, step_size)
+        model.discrete_step()
+    """
+
+    def __init__(self, model, method=RK45, max_step=None, logger=None, breakpoints=(), sink=None):
+        self.model = model
+        self.method = method
+        self.max_step = max_step
+        self.logger = logger
+        self.sink = sink
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        self._solver = None
+        self._f = None
+        self._stable_step = None
+        self._end = None
+
+    def reset(self):
+        self._solver = None
+        self._f = None
+        self._stable_step = None
+        self._end = None
+
+    def restarting(self, t, x):
+        # Whether the step from (t, x) does not continue the previous one, so that the integrator must restart.
+        if self._end is None:
+            return True
+        t_end, y_end = self._end
+        return not np.isclose(t_end, t, rtol=1e-12) or not np.allclose(y_end, x, rtol=1e-12, atol=1e-12)
+
+    def step(self, t, h):
+        # Integrates the model from t to t + h, records the state reached, and returns it.
+        x = self.model.state_vector()
+        logger = self.logger
+        if logger is not None and logger.begin_step():
+            logger.trace("Step from {} to {}.", t, t + h)
+        restart = self.restarting(t, x)
+        if restart and logger is not None:
+            logger(logging.DEBUG, "Restarting the integrator at {}.", t)
+        if self.method in FIXED_STEP_METHODS:
+            if self._f is None:
+                self._f = self.model.derivatives()
+            if restart:
+                self._stable_step = stable_step(self.method, self._f, t, x, self.max_step or h)
+            y = fixed_step_solve(self.method, self._f, t, x, [t + h], self.max_step or h, self.breakpoints,
+                                 self._stable_step)[:, 0]
+            return self.record(y, t + h)
+        bounds = [b for b in self.breakpoints if t < b < t + h] + [t + h]
+        if restart:
+            options = {}
+            if uses_jacobian(self.method) and hasattr(self.model, 'compile_jacobian'):
+                options['jac'] = self.jacobian()
+            self._solver = self.method(self.model.derivatives(), t, x, bounds[0], max_step=self.max_step or h,
+                                       **options)
+        solver = self._solver
+        for bound in bounds:
+            # Resume the integrator that finished at the previous bound, with the next one as its new bound.
+            resume(solver, bound)
+            while solver.status == 'running':
+                solver.step()
+            assert solver.status == 'finished', solver.message
+        return self.record(solver.y.copy(), solver.t)
+
+    def jacobian(self):
+        # The analytic Jacobian of the model, compiled when evaluated, so with the inputs and parameters as they are
+        # then, as the derivatives of the model read them, and not as they were when the integrator restarted.
+        model = self.model
+        return lambda t, y: model.compile_jacobian()(t, y)
+
+    def record(self, y, t):
+        self.model.record_state(y, t)
+        self._end = (t, y)
+        if self.sink is not None:
+            self.sink.after_step()
+        return y
@@ -0,0 +1,74 @@
+import numpy as np
+
+from RecalibratingTrackingSimulator import SearchResult
+from WhatIfEvaluator import trajectory_cost
+
+
+class MultiFidelitySearch:
+    """
+    Parameter search for RecalibratingTrackingSimulator that screens many candidates on a cheap surrogate of the
+    what-if simulation, and simulates only the best few of them with the what-if model.
+    The surrogate is the what-if model linearized in the parameters around the best candidate so far:
+    its tracked trajectories plus their sensitivities (see run_whatif_sensitivity) times the change of parameters,
+    so screening a grid of batch_size candidates per parameter costs no simulation.
+    The refine candidates with the lowest surrogate cost are then evaluated with evaluate_candidates,
+    bounded by the best cost (see WhatIfEvaluator), and the grid narrows around the best one, as in BatchGridSearch,
+    unless the best one is at the edge of the grid, in which case the grid moves there and keeps its width.
+    The surrogate is linearized again whenever the best candidate moves. Warm starts are as in BatchGridSearch.
+    Stops when the grid spacing is below conv_xatol, or after max_iterations. The grid keeps narrowing while the best
+    cost improves little, as the surrogate may be wrong away from the best candidate: the search stops because
+    the best cost improves less than conv_fatol only once the grid is narrower than conv_xatol times batch_size.
+    Needs a simulator with a flat what-if model, as run_whatif_sensitivity does.
+    """
+
+    def __init__(self, batch_size=64, refine=3, spread=0.5, warm_spread=0.1):
+        assert batch_size >= 3 and refine >= 1
+        self.batch_size = batch_size
+        self.refine = refine
+        # Initial half-width of the grid, relative to the guess, and its least half-width when warm started,
+        # as in BatchGridSearch.
+        self.spread = spread
+        self.warm_spread = warm_spread
+
+    def search(self, simulator, guess, t0, tf, tracked_solutions, error_space, warm_start=None):
+        target = np.asarray(tracked_solutions)
+        best = np.array(guess, dtype=float)
+        trajectories, sensitivities = simulator.run_whatif_sensitivity(best, t0, tf, tracked_solutions, error_space)
+        best_cost = trajectory_cost(trajectories, target)
+        initial_cost = best_cost
+        span = np.where(best != 0.0, np.abs(best) * self.spread, self.spread)
+        if warm_start is not None and warm_start.state is not None:
+            span = np.minimum(span, np.maximum(2.0 * warm_start.state, simulator.conv_xatol * self.batch_size))
+            span = np.maximum(span, np.abs(best) * self.warm_spread)
+        offsets = np.linspace(-1.0, 1.0, self.batch_size)
+        iterations = 0
+        converged = False
+        while not converged and iterations < simulator.max_iterations:
+            iterations += 1
+            converged = True
+            for i in range(len(best)):
+                previous_cost = best_cost
+                candidates = np.tile(best, (self.batch_size, 1))
+                candidates[:, i] += offsets * span[i]
+                # sensitivities has shape (nsignals, nparams, nsamples)
+                predicted = trajectories + np.einsum('spn,cp->csn', sensitivities, candidates - best)
+                order = np.argsort(trajectory_cost(predicted, target))[:self.refine]
+                costs = simulator.evaluate_candidates(candidates[order], t0, tf, tracked_solutions, error_space,
+                                                      bound=best_cost + simulator.conv_fatol)
+                k = np.argmin(costs)
+                at_edge = False
+                if costs[k] < best_cost:
+                    best = candidates[order[k]]
+                    best_cost = costs[k]
+                    at_edge = order[k] in (0, self.batch_size - 1)
+                    trajectories, sensitivities = simulator.run_whatif_sensitivity(best, t0, tf, tracked_solutions,
+                                                                                   error_space)
+                spacing = 2.0 * span[i] / (self.batch_size - 1)
+                if not at_edge:
+                    # Keep the neighbours of the best candidate inside the next grid.
+                    span[i] = 2.0 * spacing
+                small = spacing * (self.batch_size - 1) <= simulator.conv_xatol * self.batch_size
+                if spacing > simulator.conv_xatol and (not small or previous_cost - best_cost > simulator.conv_fatol):
+                    converged = False
+
+        return SearchResult(best, best_cost, iterations, state=np.abs(best - guess), initial_cost=initial_cost)
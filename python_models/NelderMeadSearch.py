@@ -0,0 +1,22 @@
+from scipy.optimize import minimize
+
+from RecalibratingTrackingSimulator import SearchResult
+
+
+class NelderMeadSearch:
+    """
+    Nelder-Mead from the guess, with the simulator's conv_xatol, conv_fatol and max_iterations,
+    as a recalibration_search of RecalibratingTrackingSimulator, so that each recalibration is recorded
+    as a RecalibrationRecord, e.g., to measure it (see Benchmarks). Warm starts are ignored.
+    Unlike TrackingSimulator.recalibrate, which asserts that the search converged, the best point found is accepted
+    when max_iterations is reached, so its recalibrations are not always those of TrackingSimulator.
+    """
+
+    def search(self, simulator, guess, t0, tf, tracked_solutions, error_space, warm_start=None):
+        def cost(p):
+            return simulator.evaluate_candidate(p, t0, tf, tracked_solutions, error_space)
+
+        sol = minimize(cost, guess, method='Nelder-Mead',
+                       options={'xatol': simulator.conv_xatol, 'fatol': simulator.conv_fatol,
+                                'maxiter': simulator.max_iterations})
+        return SearchResult(sol.x, sol.fun, sol.nit)
@@ -0,0 +1,130 @@
+"""
+Sweep of the tracking settings and scenario parameters of BikeTrackingWithInputScenario, run in parallel processes.
+Each run is summarized by its tracking error, number of recalibrations and wall time, in one table, e.g.:
+    python ParameterSweep.py --samples 50 --output sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import time
+
+import numpy as np
+from oomodelling.ModelSolver import ModelSolver
+
+from BikeTrackingWithInputScenario import BikeTrackingWithInputScenario
+
+# Settings that can be swept, by the part of the scenario they belong to.
+TRACKING_SETTINGS = ('tolerance', 'horizon', 'cooldown', 'nsamples', 'max_iterations', 'time_step',
+                     'conv_xatol', 'conv_fatol')
+DRIVER_SETTINGS = ('amplitude', 'nperiods', 'width', 'risingtime', 'starttime')
+SCENARIO_SETTINGS = ('Caf_before', 'Caf_after', 'Caf_step_time')
+
+# Settings of test_tracking_simulation_with_input, used for those that are not swept.
+BASE_SETTINGS = {
+    'tolerance': 0.2,
+    'horizon': 5.0,
+    'cooldown': 5.0,
+    'nsamples': 10,
+    'max_iterations': 20,
+    'time_step': 0.1,
+    'conv_xatol': 1e3,
+    'conv_fatol': 0.01,
+    'nperiods': 2,
+}
+
+# Ranges sampled by the command line sweep.
+DEFAULT_RANGES = {
+    'tolerance': (0.05, 0.5),
+    'horizon': (2.0, 8.0),
+    'cooldown': (1.0, 8.0),
+    'nsamples': (5, 40),
+    'conv_xatol': (1.0, 1e3),
+    'conv_fatol': (1e-3, 0.1),
+    'amplitude': (0.4, 1.0),
+    'nperiods': (1, 3),
+    'Caf_after': (300.0, 700.0),
+}
+
+
+def grid(**values):
+    # All combinations of the given values of each setting, e.g., grid(tolerance=[0.1, 0.2], nsamples=[10, 20]).
+    names = list(values.keys())
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def latin_hypercube(n, seed=None, **ranges):
+    # n points with each setting sampled once in each of n equal slices of its (low, high) range.
+    # Settings whose bounds are both integers get integer values.
+    rng = np.random.default_rng(seed)
+    points = [{} for _ in range(n)]
+    for name, (low, high) in ranges.items():
+        samples = low + (high - low) * (rng.permutation(n) + rng.random(n)) / n
+        for point, sample in zip(points, samples):
+            point[name] = int(round(sample)) if isinstance(low, int) and isinstance(high, int) else float(sample)
+    return points
+
+
+def apply_settings(m, settings):
+    for name, value in settings.items():
+        if name in TRACKING_SETTINGS:
+            setattr(m.tracking, name, value)
+        elif name in DRIVER_SETTINGS:
+            setattr(m.to_track.ddriver, name, value)
+        elif name in SCENARIO_SETTINGS:
+            setattr(m, name, value)
+        else:
+            raise ValueError("Unknown setting {}.".format(name))
+
+
+def run(settings, stop_time=25.0):
+    # Simulates the scenario with the settings, on top of BASE_SETTINGS, and returns its row of the table.
+    m = BikeTrackingWithInputScenario()
+    apply_settings(m, dict(BASE_SETTINGS, **settings))
+    start = time.perf_counter()
+    ModelSolver().simulate(m, 0.0, stop_time, 0.1)
+    errors = np.array(m.tracking.signals['error'])
+    row = dict(settings)
+    row.update({
+        'final_error': float(m.tracking.error()),
+        'mean_error': float(errors.mean()),
+        'max_error': float(errors.max()),
+        'recalibrations': len(m.tracking.recalibration_history),
+        'wall_time': time.perf_counter() - start,
+    })
+    return row
+
+
+def _run(args):
+    return run(*args)
+
+
+def sweep(points, stop_time=25.0, processes=None):
+    # Runs each point of the sweep, in processes worker processes (all cores by default), and returns their rows,
+    # in the same order.
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_run, [(point, stop_time) for point in points], chunksize=1)
+
+
+def write_table(rows, path):
+    names = []
+    for row in rows:
+        names += [name for name in row if name not in names]
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, names)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latin hypercube sweep of the tracking scenario settings.")
+    parser.add_argument("--samples", type=int, default=20, help="Number of runs.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stop-time", type=float, default=25.0)
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes. All cores by default.")
+    parser.add_argument("--output", default="sweep.csv", help="CSV file where the table is written.")
+    args = parser.parse_args()
+
+    rows = sweep(latin_hypercube(args.samples, args.seed, **DEFAULT_RANGES), args.stop_time, args.processes)
+    write_table(rows, args.output)
+    print("Results written to {}.".format(args.output))
@@ -0,0 +1,277 @@
+import time
+
+import numpy as np
+from oomodelling.Model import Model
+from oomodelling.TrackingSimulator import TrackingSimulator
+
+from ModelPool import ModelPool
+from SignalHistory import WindowInterpolant
+from WhatIfEvaluator import WhatIfEvaluator
+from WhatIfSolvers import ModelSolverWhatIf
+
+
+class SearchResult:
+    def __init__(self, parameters, cost, iterations, state=None, initial_cost=None):
+        self.parameters = parameters
+        self.cost = cost
+        self.iterations = iterations
+        # Internal state of the search when it stopped, used to warm start the next search.
+        self.state = state
+        # Cost of the guess, when the search knows it.
+        self.initial_cost = initial_cost
+
+
+class RecalibrationStats:
+    # Counters of the work done by what-if simulations, kept by RecalibratingTrackingSimulator and WhatIfSnapshot.
+    def __init__(self):
+        self.whatif_simulations = 0
+        self.rhs_evaluations = 0
+        self.wall_time = 0.0
+
+    def count(self, simulations, rhs_evaluations):
+        self.whatif_simulations += simulations
+        self.rhs_evaluations += rhs_evaluations
+
+
+class RecalibrationRecord:
+    """
+    A recalibration requested at time, over the window [time - horizon, time], with the tracking error then.
+    ts and xs are the times and states of the what-if simulation with the new parameters that the tracking model
+    restarted from. wall_time, whatif_simulations and rhs_evaluations measure the search and that simulation,
+    where a batch of candidates counts as one simulation per candidate, and one derivative evaluation.
+    initial_cost and cost are the costs of the guess (None if the search does not report it) and of the result.
+    """
+
+    def __init__(self, time, horizon, error, ts, xs, result, stats):
+        self.time = time
+        self.horizon = horizon
+        self.error = error
+        self.ts = ts
+        self.xs = xs
+        self.parameters = result.parameters
+        self.cost = result.cost
+        self.initial_cost = result.initial_cost
+        self.iterations = result.iterations
+        self.wall_time = stats.wall_time
+        self.whatif_simulations = stats.whatif_simulations
+        self.rhs_evaluations = stats.rhs_evaluations
+
+    def as_dict(self):
+        # The scalar fields and the parameters, e.g., to export them as JSON. The trajectory is left out.
+        return {
+            'time': float(self.time),
+            'horizon': float(self.horizon),
+            'error': float(self.error),
+            'parameters': [float(p) for p in self.parameters],
+            'initial_cost': None if self.initial_cost is None else float(self.initial_cost),
+            'cost': float(self.cost),
+            'iterations': int(self.iterations),
+            'wall_time': self.wall_time,
+            'whatif_simulations': self.whatif_simulations,
+            'rhs_evaluations': self.rhs_evaluations,
+        }
+
+
+class RecalibratingTrackingSimulator(TrackingSimulator):
+    """
+    TrackingSimulator whose parameter search can be replaced.
+    While recalibration_search is None, recalibration is left to TrackingSimulator.
+    Otherwise, recalibration_search.search(...) is used to find the new parameters, e.g., BatchGridSearch,
+    SensitivitySearch or MultiFidelitySearch. While warm_start is set, each search is given the result of the
+    previous one, so that it resumes from the step size (or damping) it ended with, instead of starting over.
+    Recalibrations are triggered as in TrackingSimulator, when the error exceeds the tolerance and cooldown seconds
+    have passed since the last one, over the last horizon seconds, or since the start, if that is shorter.
+    How the rest is done is left to the following strategies:
+    whatif_solver integrates single what-if models, e.g., ModelSolverWhatIf (the default), CompiledWhatIf or
+    FixedStepWhatIf (see WhatIfSolvers).
+    whatif_evaluator evaluates the candidates of the searches, e.g., in worker processes, or abandoning the bad ones
+    early (see WhatIfEvaluator).
+    whatif_cache, when set, e.g., to a WhatIfCache, keeps the what-if trajectories that whatif_evaluator simulated,
+    so that candidates probed again are not simulated again.
+    recalibration_scheduler, when set, e.g., to a TrackingManager, is asked to recalibrate instead of doing it right away.
+    background_recalibration, when set, e.g., to a BackgroundRecalibration, runs the searches while the tracking model
+    keeps stepping.
+    history, when set, e.g., to a TrackedHistory, keeps the tracked signals, and bounds the memory taken by the signals.
+    Each recalibration is recorded in recalibration_history as a RecalibrationRecord, which has its wall time,
+    number of what-if simulations and derivative evaluations, costs and iterations. When recalibration_callback
+    is set, it is called with each record, e.g., a RecalibrationExporter. stats has the totals since the start.
+    What-if models are obtained from whatif_model, which reuses the models of previous what-if simulations
+    (see ModelPool), instead of constructing new ones.
+    Their inputs are obtained from past_signal, which builds the table of each recorded signal once per what-if window,
+    and gives the same one to all the what-if simulations of the window, until the recalibration ends.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.recalibration_search = None
+        self.warm_start = True
+        self.whatif_solver = ModelSolverWhatIf()
+        self.whatif_evaluator = WhatIfEvaluator()
+        self.whatif_cache = None
+        self.recalibration_scheduler = None
+        self.background_recalibration = None
+        self.history = None
+        self.recalibration_callback = None
+        self.stats = RecalibrationStats()
+        self._last_result = None
+        self._recalibration_tracked = []
+        self._model_pools = {}
+        self._pooled_models = {}
+        self._past_signals = {}
+
+    def match_signals(self, to_track, tracking):
+        super().match_signals(to_track, tracking)
+        self._recalibration_tracked.append(to_track)
+
+    def discrete_step(self):
+        # The windows of the previous recalibrations, if any, are over.
+        self._past_signals.clear()
+        self.record_history()
+        if self.recalibration_search is None:
+            return super().discrete_step()
+        # Skip the recalibration of TrackingSimulator, and do our own.
+        updated = Model.discrete_step(self)
+        if self.background_recalibration is not None and self.background_recalibration.done():
+            self.finish_background_recalibration()
+            updated = True
+        elif self.needs_recalibration():
+            if self.recalibration_scheduler is not None:
+                # The scheduler decides when to call recalibrate_with_search.
+                self.recalibration_scheduler.request_recalibration(self)
+            else:
+                self.recalibrate_with_search()
+                updated = True
+        return updated
+
+    def needs_recalibration(self):
+        if self.background_recalibration is not None and self.background_recalibration.pending():
+            return False
+        return self.time() - self.last_calibration_time > self.cooldown and self.error() > self.tolerance
+
+    def record_history(self):
+        if self.history is not None:
+            self.history.record(self, self._recalibration_tracked)
+
+    def tracked_solutions(self, tf, error_space):
+        if self.history is not None and self.history.recorded():
+            return list(self.history.values_at(self._recalibration_tracked, tf, error_space))
+        return [np.array([s(-(tf - t)) for t in error_space]) for s in self._recalibration_tracked]
+
+    def recalibrate_with_search(self):
+        started = (self.error(), time.perf_counter(), self.stats.whatif_simulations, self.stats.rhs_evaluations)
+        tf = self.time()
+        # As TrackingSimulator, the window does not go before the start.
+        t0 = tf - min(tf, self.horizon)
+        error_space = np.linspace(t0, tf, self.nsamples)
+        tracked_solutions = self.tracked_solutions(tf, error_space)
+        warm_start = self._last_result if self.warm_start else None
+        self.last_calibration_time = tf
+        guess = self.get_parameter_guess()
+        background = self.background_recalibration
+        if background is not None and background.submit(self, t0, tf, tracked_solutions, error_space, guess,
+                                                        warm_start, started):
+            return
+        result = self.recalibration_search.search(self, guess, t0, tf, tracked_solutions, error_space,
+                                                  warm_start=warm_start)
+        self.close_whatif_pool()
+        self.accept_recalibration(result, t0, tf, started)
+
+    def finish_background_recalibration(self):
+        t0, tf, result, stats, started = self.background_recalibration.result()
+        self.stats.count(stats.whatif_simulations, stats.rhs_evaluations)
+        self.accept_recalibration(result, t0, tf, started, search_time=stats.wall_time)
+
+    def accept_recalibration(self, result, t0, requested, started, search_time=None):
+        # Simulates the new parameters from t0 up to now, which is after the requested time for background
+        # recalibrations, and restarts the tracking model from the state reached.
+        # started has the error, wall clock and counters when the recalibration was requested.
+        # search_time is the wall time of a background search, as the time since started then also covers
+        # the steps of the tracking model while the search ran.
+        simulation_start = time.perf_counter()
+        tf = self.time()
+        error_space = np.linspace(t0, tf, self.nsamples)
+        tracked_solutions = self.tracked_solutions(tf, error_space)
+        xs = self.run_whatif_simulation(result.parameters, t0, tf, tracked_solutions, error_space, only_tracked_state=False)
+        self.update_tracking_model(xs[:, -1], result.parameters)
+        error, start, whatif_simulations, rhs_evaluations = started
+        stats = RecalibrationStats()
+        if search_time is None:
+            stats.wall_time = time.perf_counter() - start
+        else:
+            stats.wall_time = search_time + (time.perf_counter() - simulation_start)
+        stats.count(self.stats.whatif_simulations - whatif_simulations, self.stats.rhs_evaluations - rhs_evaluations)
+        self.stats.wall_time += stats.wall_time
+        record = RecalibrationRecord(requested, requested - t0, error, error_space, xs, result, stats)
+        self.recalibration_history.append(record)
+        self._last_result = result
+        self._past_signals.clear()
+        if self.recalibration_callback is not None:
+            self.recalibration_callback(record)
+
+    def past_signal(self, model, name, t0, tf):
+        # The signal recorded by model under name, as a function of time over the what-if window [t0, tf].
+        # Used as input of what-if models, so that evaluating their derivatives does not search the whole history.
+        # Built once per window, as the signal is sliced from the whole history, and kept until the recalibration ends.
+        key = (model, name, t0, tf)
+        interpolant = self._past_signals.get(key)
+        if interpolant is None:
+            interpolant = self._past_signals[key] = WindowInterpolant.from_signals(model, name, t0, tf)
+        return interpolant
+
+    def whatif_model(self, factory, values=()):
+        # A reset what-if model built by factory, with the given values (see ModelPool.get).
+        # simulate_whatif gives it back to its pool, so it must not be used afterwards.
+        pool = self._model_pools.get(factory)
+        if pool is None:
+            pool = self._model_pools[factory] = ModelPool(factory)
+        m = pool.get(values)
+        self._pooled_models[id(m)] = pool
+        return m
+
+    def simulate_whatif(self, m, t0, tf, error_space, **inputs):
+        # Returns the states of the what-if model m at error_space.
+        # inputs are the time-varying inputs of m, given as functions of time, for the compiled derivatives.
+        try:
+            ys, nfev = self.whatif_solver.simulate(m, t0, tf, self.time_step, error_space, **inputs)
+        finally:
+            pool = self._pooled_models.pop(id(m), None)
+            if pool is not None:
+                pool.put(m)
+        self.stats.count(1, nfev)
+        return ys
+
+    def evaluate_candidate(self, parameters, t0, tf, tracked_solutions, error_space, bound=None):
+        return self.whatif_evaluator.evaluate_candidate(self, parameters, t0, tf, tracked_solutions, error_space, bound)
+
+    def evaluate_candidates(self, candidates, t0, tf, tracked_solutions, error_space, bound=None):
+        return self.whatif_evaluator.evaluate_candidates(self, candidates, t0, tf, tracked_solutions, error_space,
+                                                         bound)
+
+    def whatif_state(self, t0, tf):
+        # Simulators return the initial state of their what-if simulations of the window [t0, tf] here,
+        # which identifies the window for a WhatIfCache, together with whatif_inputs and the parameters.
+        return None
+
+    def whatif_inputs(self, t0, tf):
+        # The time-varying inputs of the what-if simulations of the window [t0, tf], e.g., the tables of past_signal,
+        # which those of whatif_flat are, by default. None when they are not known.
+        whatif = self.whatif_flat(t0, tf)
+        return None if whatif is None else whatif.inputs
+
+    def whatif_flat(self, t0, tf):
+        # Simulators whose what-if model has flat equations return a FlatWhatIf for the window [t0, tf] here.
+        # This enables run_whatif_batch to integrate all candidates together, possibly in worker processes,
+        # and run_whatif_sensitivity.
+        return None
+
+    def run_whatif_batch(self, candidates, t0, tf, tracked_solutions, error_space):
+        # Returns the tracked trajectories of each candidate, with shape (ncandidates, nsignals, len(error_space)).
+        return self.whatif_evaluator.run_batch(self, candidates, t0, tf, tracked_solutions, error_space)
+
+    def run_whatif_sensitivity(self, parameters, t0, tf, tracked_solutions, error_space):
+        # Returns the tracked trajectories, as run_whatif_simulation,
+        # and their sensitivities to the parameters, with shape (nsignals, nparams, len(error_space)).
+        return self.whatif_evaluator.run_sensitivity(self, parameters, t0, tf, tracked_solutions, error_space)
+
+    def close_whatif_pool(self):
+        self.whatif_evaluator.close()
@@ -0,0 +1,20 @@
+import json
+
+
+class RecalibrationExporter:
+    """
+    Writes each RecalibrationRecord it is called with as one line of JSON (see RecalibrationRecord.as_dict)
+    to stream, e.g., a file, or a pipe read by a metrics collector.
+    Set it as the recalibration_callback of a RecalibratingTrackingSimulator.
+    Fields given in labels, e.g., the name of the simulator, are added to every line.
+    """
+
+    def __init__(self, stream, **labels):
+        self.stream = stream
+        self.labels = labels
+
+    def __call__(self, record):
+        fields = dict(self.labels)
+        fields.update(record.as_dict())
+        self.stream.write(json.dumps(fields) + "\n")
+        self.stream.flush()
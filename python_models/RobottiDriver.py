@@ -2,11 +2,28 @@ import math
 
 from oomodelling.Model import Model
 
+from DriverProfiles import SineProfile
+
 
 class RobottiDriver(Model):
 
     def __init__(self):
         super().__init__()
-        self.steering = self.var(lambda: 0.5*math.sin((math.pi/10.0)*self.time()))
+        self.amplitude = self.parameter(0.5)
+        self.frequency = self.parameter(math.pi/10.0)
+        self.steering = self.var(lambda: float(self.profile()(self.time())))
+        self._profile = None
+        self._profile_parameters = None
         self.save()
 
+    def profile(self):
+        # The steering as a pure function of time, with the parameters as they are now.
+        # It is smooth, so it has no breakpoints.
+        parameters = (self.amplitude, self.frequency)
+        if parameters != self._profile_parameters:
+            self._profile = SineProfile(*parameters)
+            self._profile_parameters = parameters
+        return self._profile
+
+    def breakpoints(self):
+        return self.profile().breakpoints
@@ -1,7 +1,10 @@
 import math
 
+import numpy as np
 from oomodelling.Model import Model
 
+from FlatModel import held, flat_derivatives, flat_jacobian
+
 
 class RobottiDynamicModel(Model):
     def __init__(self):
@@ -111,4 +114,155 @@ class RobottiDynamicModel(Model):
 
         self.save()
 
+    def compile_derivatives(self, **inputs):
+        # Flat alternative to self.derivatives(), usable directly as the f given to solve_ivp.
+        # inputs may give any of ROBOTTI_INPUTS as functions of time.
+        # Parameters, and the inputs that are not given, are bound to their current value.
+        u = self._flat_inputs(inputs)
+        p = robotti_parameters(self)
+        return flat_derivatives(self, ROBOTTI_STATES,
+                                lambda t, s: robotti_derivatives(s, *[ui(t) for ui in u], *p))
+
+    def compile_jacobian(self, **inputs):
+        # Jacobian of compile_derivatives(**inputs) with respect to the state vector, e.g., for the jac of BDF or Radau.
+        u = self._flat_inputs(inputs)
+        p = robotti_parameters(self)
+        return flat_jacobian(self, ROBOTTI_STATES,
+                             lambda t, s: robotti_jacobian(s, *[ui(t) for ui in u], *p))
+
+    def _flat_inputs(self, inputs):
+        return [inputs[name] if name in inputs else held(getattr(self, name)()) for name in ROBOTTI_INPUTS]
+
+
+# State order used by robotti_derivatives. Matches the order in which RobottiDynamicModel declares its states.
+ROBOTTI_STATES = ('x', 'X', 'Y', 'y', 'vy', 'psi', 'dpsi')
+# Inputs of robotti_derivatives, in order.
+ROBOTTI_INPUTS = ('Caf', 'deltaFl', 'deltaFr', 'deltaRl', 'deltaRr', 'vel_left', 'vel_right')
+
+
+def robotti_parameters(r):
+    # Parameters of robotti_derivatives, in order, taken from a RobottiDynamicModel.
+    return (r.T, r.Car, r.mu, r.m, r.Iz, r.lf, r.lr, r.Nlfl, r.Nlfr, r.Nlrl, r.Nlrr, r.wheel_radius, r.Cs, r.SC)
+
+
+# Base parameters of RobottiDynamicModel, from which robotti_derived_parameters computes the rest.
+ROBOTTI_BASE_PARAMETERS = ('T', 'L', 'front_to_rear_ratio', 'lr_ratio', 'Car', 'mu', 'l_ext', 'm', 'g',
+                           'M_ext', 'm_ext_l', 'm_ext_r', 'wheel_radius', 'Cs', 'SC')
+
+
+def robotti_derived_parameters(T, L, front_to_rear_ratio, lr_ratio, Car, mu, l_ext, m, g, M_ext, m_ext_l, m_ext_r,
+                               wheel_radius, Cs, SC):
+    # Parameters of robotti_derivatives, in order, derived from the base parameters as in RobottiDynamicModel.
+    # Works elementwise, e.g., with arrays holding one value per robot.
+    m_robot_l = m*(1.0-lr_ratio)
+    m_robot_r = m*lr_ratio
+    Iz = m/12.0*(T**2+L**2)
+    lf = L*front_to_rear_ratio
+    lr = L*(1.0-front_to_rear_ratio)
+    Nlrl = (lf*m_robot_l*g - M_ext) / L
+    Nlrr = m_robot_r*g*(lf/L)
+    Nlfr = m_robot_r*g*(lr/L)+m_ext_r*g
+    Nlfl = 1/L*(m_robot_l*g*lr+m_ext_l*g*(L-l_ext))
+    return (T, Car, mu, m, Iz, lf, lr, Nlfl, Nlfr, Nlrl, Nlrr, wheel_radius, Cs, SC)
+
+
+def _tyre_force(alpha, C_switch, N_switch, N, C_nonlinear, C_linear, mu):
+    # Tyre model of RobottiDynamicModel: linear until the force saturates, then nonlinear.
+    tan_alpha = np.tan(alpha)
+    use_nonlinear = np.abs(-C_switch*tan_alpha) - mu*N_switch/2 > 0
+    # The nonlinear branch is only evaluated where it is used, as it divides by tan(alpha).
+    nonlinear_tan = np.where(use_nonlinear, tan_alpha, 1.0)
+    nonlinear = -mu*N*np.sign(alpha)*(1-(mu*N) / (4*C_nonlinear*np.abs(nonlinear_tan)))
+    return np.where(use_nonlinear, nonlinear, -C_linear*tan_alpha)
+
+
+def _tyre_force_derivative(alpha, C_switch, N_switch, N, C_nonlinear, C_linear, mu):
+    # Derivative of _tyre_force with respect to alpha.
+    tan_alpha = np.tan(alpha)
+    use_nonlinear = np.abs(-C_switch*tan_alpha) - mu*N_switch/2 > 0
+    nonlinear_tan = np.where(use_nonlinear, tan_alpha, 1.0)
+    nonlinear = -(mu*N)**2 / (4*C_nonlinear) * np.sign(alpha)*np.sign(nonlinear_tan) * (1 + nonlinear_tan**2) / nonlinear_tan**2
+    return np.where(use_nonlinear, nonlinear, -C_linear*(1 + tan_alpha**2))
+
+
+def _tyre_force_stiffness_derivative(alpha, C_switch, N_switch, N, C, mu):
+    # Derivative of _tyre_force, with the same stiffness C in both branches, with respect to C.
+    # The switch between the branches does not contribute.
+    tan_alpha = np.tan(alpha)
+    use_nonlinear = np.abs(-C_switch*tan_alpha) - mu*N_switch/2 > 0
+    nonlinear_tan = np.where(use_nonlinear, tan_alpha, 1.0)
+    nonlinear = -(mu*N)**2 * np.sign(alpha) / (4*C**2*np.abs(nonlinear_tan))
+    return np.where(use_nonlinear, nonlinear, -tan_alpha)
+
+
+def robotti_derivatives(s, Caf, deltaFl, deltaFr, deltaRl, deltaRr, vel_left, vel_right,
+                        T, Car, mu, m, Iz, lf, lr, Nlfl, Nlfr, Nlrl, Nlrr, wheel_radius, Cs, SC):
+    # Same equations as RobottiDynamicModel, but over a plain state array ordered as ROBOTTI_STATES.
+    # Each row of s, the inputs and the parameters may also be arrays, in which case many robots are evaluated at once.
+    x, X, Y, y, vy, psi, dpsi = s
+    omega = (vel_left-vel_right)*wheel_radius * (T/2) / wheel_radius*Cs
+    vx = (vel_left+vel_right)*wheel_radius/2 * SC
+
+    alphaFl = np.arctan((vy + lf*dpsi) / (vx + ((T/2) * dpsi)))-deltaFl
+    alphaFr = np.arctan((vy + lf*dpsi) / (vx - ((T/2) * dpsi)))-deltaFr
+    alphaRl = np.arctan((vy - lf*dpsi) / (vx + ((T/2) * dpsi)))-deltaRl
+    alphaRr = np.arctan((vy - lf*dpsi) / (vx - ((T/2) * dpsi)))-deltaRr
+
+    # The choice of loads and stiffnesses in each tyre is kept exactly as in RobottiDynamicModel.
+    Fyfl = _tyre_force(alphaFl, Caf, Nlfl, Nlfr, Caf, Caf, mu)
+    Fyfr = _tyre_force(alphaFr, Caf, Nlfr, Nlfr, Caf, Caf, mu)
+    Fyrl = _tyre_force(alphaRl, Caf, Nlrl, Nlrl, Car, Car, mu)
+    Fyrr = _tyre_force(alphaRr, Car, Nlrr, Nlrr, Car, Car, mu)
+
+    Fcf = Fyfl + Fyfr
+    Fcr = Fyrl + Fyrr
+
+    return np.array([
+        vx*np.ones_like(vy),  # vx depends only on the inputs, so it has to be broadcast to the shape of the states.
+        vx*np.cos(psi) - vy*np.sin(psi),
+        vx*np.sin(psi) + vy*np.cos(psi),
+        vy,
+        (1/m)*(Fcf + Fcr) - dpsi*vx,
+        dpsi,
+        (1/Iz)*(lf*Fcf - lr*Fcr) + omega,
+    ])
+
+
+def robotti_jacobian(s, Caf, deltaFl, deltaFr, deltaRl, deltaRr, vel_left, vel_right,
+                     T, Car, mu, m, Iz, lf, lr, Nlfl, Nlfr, Nlrl, Nlrr, wheel_radius, Cs, SC):
+    # Analytic Jacobian of robotti_derivatives with respect to s.
+    x, X, Y, y, vy, psi, dpsi = s
+    vx = (vel_left+vel_right)*wheel_radius/2 * SC
+
+    # Partial derivatives of each slip angle atan(n/d) with respect to vy and dpsi.
+    def dalpha(n, dn_ddpsi, d, dd_ddpsi):
+        return np.array([d, d*dn_ddpsi - n*dd_ddpsi]) / (n**2 + d**2)
+    nF, nR = vy + lf*dpsi, vy - lf*dpsi
+    dL, dR = vx + (T/2)*dpsi, vx - (T/2)*dpsi
+
+    dFcf = (_tyre_force_derivative(np.arctan(nF/dL)-deltaFl, Caf, Nlfl, Nlfr, Caf, Caf, mu) * dalpha(nF, lf, dL, T/2) +
+            _tyre_force_derivative(np.arctan(nF/dR)-deltaFr, Caf, Nlfr, Nlfr, Caf, Caf, mu) * dalpha(nF, lf, dR, -T/2))
+    dFcr = (_tyre_force_derivative(np.arctan(nR/dL)-deltaRl, Caf, Nlrl, Nlrl, Car, Car, mu) * dalpha(nR, -lf, dL, T/2) +
+            _tyre_force_derivative(np.arctan(nR/dR)-deltaRr, Car, Nlrr, Nlrr, Car, Car, mu) * dalpha(nR, -lf, dR, -T/2))
+
+    VY, PSI, DPSI = 4, 5, 6
+    J = np.zeros((7, 7))
+    J[1, [VY, PSI]] = [-np.sin(psi), -vx*np.sin(psi) - vy*np.cos(psi)]
+    J[2, [VY, PSI]] = [np.cos(psi), vx*np.cos(psi) - vy*np.sin(psi)]
+    J[3, VY] = 1.0
+    J[4, [VY, DPSI]] = (dFcf + dFcr)/m + [0.0, -vx]
+    J[5, DPSI] = 1.0
+    J[6, [VY, DPSI]] = (lf*dFcf - lr*dFcr)/Iz
+    return J
+
 
+def robotti_jacobian_caf(s, Caf, deltaFl, deltaFr, vel_left, vel_right, T, mu, m, Iz, lf, Nlfl, Nlfr, wheel_radius, SC):
+    # Derivative of robotti_derivatives with respect to Caf.
+    # Caf is the stiffness of both front tyres, and only decides the switch of the rear left one.
+    x, X, Y, y, vy, psi, dpsi = s
+    vx = (vel_left+vel_right)*wheel_radius/2 * SC
+    alphaFl = np.arctan((vy + lf*dpsi) / (vx + ((T/2) * dpsi)))-deltaFl
+    alphaFr = np.arctan((vy + lf*dpsi) / (vx - ((T/2) * dpsi)))-deltaFr
+    dFcf = (_tyre_force_stiffness_derivative(alphaFl, Caf, Nlfl, Nlfr, Caf, mu) +
+            _tyre_force_stiffness_derivative(alphaFr, Caf, Nlfr, Nlfr, Caf, mu))
+    return np.array([0.0, 0.0, 0.0, 0.0, dFcf/m, 0.0, lf*dFcf/Iz])
@@ -0,0 +1,52 @@
+import numpy as np
+
+from BatchSolver import BatchSolver
+from DriverProfiles import profile_breakpoints
+from FlatModel import held
+from RobottiDynamicModel import RobottiDynamicModel, ROBOTTI_STATES, ROBOTTI_INPUTS, ROBOTTI_BASE_PARAMETERS, \
+    robotti_derived_parameters, robotti_derivatives
+
+
+class RobottiFleet:
+    """
+    n Robotti robots, simulated together with the equations of RobottiDynamicModel.
+    The states are an (nstates x n) array, ordered as ROBOTTI_STATES, one column per robot.
+    The base parameters (see ROBOTTI_BASE_PARAMETERS) default to those of RobottiDynamicModel,
+    and can be given as scalars, shared by all robots, or as arrays with one value per robot, e.g.,
+    RobottiFleet(500, mu=np.random.uniform(0.4, 0.8, 500), lr_ratio=0.6).
+    The inputs (see ROBOTTI_INPUTS), e.g., fleet.vel_left, are functions of time returning a scalar or an array
+    with one value per robot. When they are steering profiles, e.g., RobottiDriver().profile(), the integration stops
+    at their breakpoints, and all robots share the same profile.
+    The derived parameters, such as the normal loads, are computed once, so parameters should not be changed
+    after construction.
+    """
+
+    def __init__(self, n, **parameters):
+        self.n = n
+        reference = RobottiDynamicModel()
+        base = [np.broadcast_to(parameters.get(name, getattr(reference, name)), (n,)).astype(float)
+                for name in ROBOTTI_BASE_PARAMETERS]
+        self.parameters = robotti_derived_parameters(*base)
+        for name in ROBOTTI_INPUTS:
+            setattr(self, name, held(getattr(reference, name)()))
+        self.states = np.zeros((len(ROBOTTI_STATES), n))
+        self.t = 0.0
+
+    def state(self, name):
+        # Values of the state name, one per robot.
+        return self.states[ROBOTTI_STATES.index(name)]
+
+    def derivatives(self, t, s):
+        return robotti_derivatives(s, *[getattr(self, name)(t) for name in ROBOTTI_INPUTS], *self.parameters)
+
+    def simulate(self, tf, h, t_eval=None, method='RK45'):
+        # Advances all robots from the current time to tf, with steps of at most h,
+        # and returns the states at t_eval (tf by default), with shape (nstates, n, len(t_eval)).
+        outputs = [tf] if t_eval is None else list(t_eval)
+        extra = not np.isclose(outputs[-1], tf)
+        breakpoints = profile_breakpoints(*[getattr(self, name) for name in ROBOTTI_INPUTS])
+        ys = BatchSolver(method).simulate(self.derivatives, self.states, self.t, tf, h,
+                                          outputs + [tf] if extra else outputs, breakpoints)
+        self.states = ys[..., -1]
+        self.t = tf
+        return ys[..., :-1] if extra else ys
@@ -1,14 +1,14 @@
 from oomodelling.Model import Model
-from oomodelling.ModelSolver import ModelSolver
-from oomodelling.TrackingSimulator import TrackingSimulator
 
-from BikeDynamicModelSpeedDriven import BikeDynamicModelSpeedDriven
+from BikeDynamicModelSpeedDriven import BikeDynamicModelSpeedDriven, BIKE_SPEED_DRIVEN_STATES
+from FlatWhatIf import BikeSpeedDrivenWhatIf
+from RecalibratingTrackingSimulator import RecalibratingTrackingSimulator
 from RobottiDriver import RobottiDriver
 from RobottiDynamicModel import RobottiDynamicModel
 import numpy as np
 
 
-class RobottiTrackingSimulator(TrackingSimulator):
+class RobottiTrackingSimulator(RecalibratingTrackingSimulator):
 
     def __init__(self):
         super().__init__()
@@ -43,37 +43,44 @@ class RobottiTrackingSimulator(TrackingSimulator):
 
     def run_whatif_simulation(self, new_parameters, t0, tf, tracked_solutions, error_space, only_tracked_state=True):
         new_caf = new_parameters[0]
-        m = self.get_new_bike_model()
+        deltaf = self.past_signal(self.driver, 'steering', t0, tf)
+        vx = self.past_signal(self.robot, 'vx', t0, tf)
+        assert np.isclose(self.robot.X(-(tf - t0)), tracked_solutions[0][0])
+        assert np.isclose(self.robot.Y(-(tf - t0)), tracked_solutions[1][0])
+        # Initialize the state to the state at t0
+        m = self.whatif_model(self.get_new_bike_model, dict(zip(BIKE_SPEED_DRIVEN_STATES, self.whatif_state(t0, tf))))
         # Set new parameter
         m.Caf = lambda: new_caf
         # Rewrite control input to mimic the past behavior.
-        m.deltaf = lambda: self.driver.steering(-(tf - m.time()))
-        m.vx = lambda: self.robot.vx(-(tf - m.time()))
+        m.deltaf = lambda: deltaf(m.time())
+        m.vx = lambda: vx(m.time())
 
-        assert np.isclose(self.robot.X(-(tf - t0)), tracked_solutions[0][0])
-        assert np.isclose(self.robot.Y(-(tf - t0)), tracked_solutions[1][0])
-        # Initialize the state to the state at t0
-        m.x = self.dbike.x(-(tf - t0))
-        m.X = self.robot.X(-(tf - t0))
-        m.y = self.dbike.y(-(tf - t0))
-        m.Y = self.robot.Y(-(tf - t0))
-        m.vx = self.dbike.vx(-(tf - t0))
-        m.vy = self.dbike.vy(-(tf - t0))
-        m.psi = self.dbike.psi(-(tf - t0))
-        m.dpsi = self.dbike.dpsi(-(tf - t0))
-
-        sol = ModelSolver().simulate(m, t0, tf, self.time_step, error_space)
-        new_trajectories = sol.y
+        sol_y = self.simulate_whatif(m, t0, tf, error_space, deltaf=deltaf, vx=vx)
+        new_trajectories = sol_y
         if only_tracked_state:
             new_trajectories = np.array([
-                sol.y[self.X_idx, :],
-                sol.y[self.Y_idx, :]
+                sol_y[self.X_idx, :],
+                sol_y[self.Y_idx, :]
             ])
             assert len(new_trajectories) == 2
-            assert len(new_trajectories[0, :]) == len(sol.y[0, :])
+            assert len(new_trajectories[0, :]) == len(sol_y[0, :])
 
         return new_trajectories
 
+    def whatif_state(self, t0, tf):
+        # Initial state of the what-if simulations of the window [t0, tf], ordered as BIKE_SPEED_DRIVEN_STATES:
+        # the tracking model's, except for the tracked X and Y.
+        x0 = np.array([getattr(self.dbike, s)(-(tf - t0)) for s in BIKE_SPEED_DRIVEN_STATES])
+        x0[BIKE_SPEED_DRIVEN_STATES.index('X')] = self.robot.X(-(tf - t0))
+        x0[BIKE_SPEED_DRIVEN_STATES.index('Y')] = self.robot.Y(-(tf - t0))
+        return x0
+
+    def whatif_flat(self, t0, tf):
+        # Same what-if simulation as run_whatif_simulation.
+        return BikeSpeedDrivenWhatIf(self.robot, self.whatif_state(t0, tf),
+                                     self.past_signal(self.driver, 'steering', t0, tf),
+                                     self.past_signal(self.robot, 'vx', t0, tf))
+
     def update_tracking_model(self, new_present_state, new_parameter):
         self.dbike.record_state(new_present_state, self.time(), override=True)
         self.dbike.Caf = lambda: new_parameter[0]
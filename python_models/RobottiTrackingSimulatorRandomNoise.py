@@ -1,15 +1,15 @@
 from oomodelling.Model import Model
-from oomodelling.ModelSolver import ModelSolver
-from oomodelling.TrackingSimulator import TrackingSimulator
 
 from BikeDynamicModelSpeedDriven import BikeDynamicModelSpeedDriven
 from DriverDynamic import DriverDynamic
 from RobottiDriver import RobottiDriver
-from RobottiDynamicModel import RobottiDynamicModel
+from FlatWhatIf import RobottiWhatIf
+from RobottiDynamicModel import RobottiDynamicModel, ROBOTTI_STATES
+from RecalibratingTrackingSimulator import RecalibratingTrackingSimulator
 import numpy as np
 
 
-class RobottiTrackingSimulatorRandomNoise(TrackingSimulator):
+class RobottiTrackingSimulatorRandomNoise(RecalibratingTrackingSimulator):
 
     def __init__(self):
         super().__init__()
@@ -34,36 +34,42 @@ class RobottiTrackingSimulatorRandomNoise(TrackingSimulator):
 
     def run_whatif_simulation(self, new_parameters, t0, tf, tracked_solutions, error_space, only_tracked_state=True):
         new_caf = new_parameters[0]
-        m = RobottiDynamicModel()
+        steering = self.past_signal(self.driver, 'steering', t0, tf)
+        assert np.isclose(self.robot.X(-(tf - t0)), tracked_solutions[0][0])
+        assert np.isclose(self.robot.Y(-(tf - t0)), tracked_solutions[1][0])
+        # Initialize the state to the state at t0
+        m = self.whatif_model(RobottiDynamicModel, dict(zip(ROBOTTI_STATES, self.whatif_state(t0, tf))))
         # Set new parameter
         m.Caf = lambda: new_caf
         # Rewrite control input to mimic the past behavior.
-        m.deltaFl = lambda: self.driver.steering(-(tf - m.time()))
-        m.deltaFr = lambda: self.driver.steering(-(tf - m.time()))
+        m.deltaFl = lambda: steering(m.time())
+        m.deltaFr = lambda: steering(m.time())
 
-        assert np.isclose(self.robot.X(-(tf - t0)), tracked_solutions[0][0])
-        assert np.isclose(self.robot.Y(-(tf - t0)), tracked_solutions[1][0])
-        # Initialize the state to the state at t0
-        m.x = self.tracking.x(-(tf - t0))
-        m.X = self.robot.X(-(tf - t0))
-        m.y = self.tracking.y(-(tf - t0))
-        m.Y = self.robot.Y(-(tf - t0))
-        m.vy = self.tracking.vy(-(tf - t0))
-        m.psi = self.tracking.psi(-(tf - t0))
-        m.dpsi = self.tracking.dpsi(-(tf - t0))
-
-        sol = ModelSolver().simulate(m, t0, tf, self.time_step, error_space)
-        new_trajectories = sol.y
+        sol_y = self.simulate_whatif(m, t0, tf, error_space, deltaFl=steering, deltaFr=steering)
+        new_trajectories = sol_y
         if only_tracked_state:
             new_trajectories = np.array([
-                sol.y[self.X_idx, :],
-                sol.y[self.Y_idx, :]
+                sol_y[self.X_idx, :],
+                sol_y[self.Y_idx, :]
             ])
             assert len(new_trajectories) == 2
-            assert len(new_trajectories[0, :]) == len(sol.y[0, :])
+            assert len(new_trajectories[0, :]) == len(sol_y[0, :])
 
         return new_trajectories
 
+    def whatif_state(self, t0, tf):
+        # Initial state of the what-if simulations of the window [t0, tf], ordered as ROBOTTI_STATES:
+        # the tracking model's, except for the tracked X and Y.
+        x0 = np.array([getattr(self.tracking, s)(-(tf - t0)) for s in ROBOTTI_STATES])
+        x0[ROBOTTI_STATES.index('X')] = self.robot.X(-(tf - t0))
+        x0[ROBOTTI_STATES.index('Y')] = self.robot.Y(-(tf - t0))
+        return x0
+
+    def whatif_flat(self, t0, tf):
+        # Same what-if simulation as run_whatif_simulation.
+        steering = self.past_signal(self.driver, 'steering', t0, tf)
+        return RobottiWhatIf(self.tracking, self.whatif_state(t0, tf), steering, steering)
+
     def update_tracking_model(self, new_present_state, new_parameter):
         self.tracking.record_state(new_present_state, self.time(), override=True)
         self.tracking.Caf = lambda: new_parameter[0]
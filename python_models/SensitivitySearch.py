@@ -0,0 +1,52 @@
+import numpy as np
+
+from RecalibratingTrackingSimulator import SearchResult
+
+
+class SensitivitySearch:
+    """
+    Levenberg-Marquardt parameter search for RecalibratingTrackingSimulator.
+    The gradient of the trajectories with respect to the parameters comes from run_whatif_sensitivity,
+    so each iteration costs a single what-if simulation.
+    Stops when a step is below conv_xatol, the cost improves less than conv_fatol, or after max_iterations.
+    When warm started, the damping starts where the previous search left it, if that is lower.
+    """
+
+    def __init__(self, damping=1e-3):
+        self.damping = damping
+
+    def search(self, simulator, guess, t0, tf, tracked_solutions, error_space, warm_start=None):
+        target = np.asarray(tracked_solutions)
+
+        def residuals(p):
+            trajectories, sensitivities = simulator.run_whatif_sensitivity(p, t0, tf, tracked_solutions, error_space)
+            r = (trajectories - target).reshape(-1)
+            # sensitivities has shape (nsignals, nparams, nsamples)
+            return r, sensitivities.transpose(0, 2, 1).reshape(len(r), len(p))
+
+        p = np.array(guess, dtype=float)
+        r, J = residuals(p)
+        cost = r @ r
+        initial_cost = cost
+        damping = self.damping if warm_start is None or warm_start.state is None else min(warm_start.state, self.damping)
+        iterations = 0
+        while iterations < simulator.max_iterations:
+            iterations += 1
+            A = J.T @ J
+            step = np.linalg.lstsq(A + damping*np.diag(np.diag(A)), -J.T @ r, rcond=None)[0]
+            small_step = np.all(np.abs(step) <= simulator.conv_xatol)
+            new_p = p + step
+            new_r, new_J = residuals(new_p)
+            new_cost = new_r @ new_r
+            if new_cost < cost:
+                converged = small_step or cost - new_cost <= simulator.conv_fatol
+                p, r, J, cost = new_p, new_r, new_J, new_cost
+                damping /= 10.0
+                if converged:
+                    break
+            else:
+                damping *= 10.0
+                if small_step:
+                    break
+
+        return SearchResult(p, cost, iterations, state=damping, initial_cost=initial_cost)
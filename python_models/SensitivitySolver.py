@@ -0,0 +1,26 @@
+import numpy as np
+from scipy.integrate import solve_ivp, RK45
+
+
+class SensitivitySolver:
+    """
+    Simulates a FlatWhatIf together with the sensitivities of its states to the parameters,
+    S = ds/dp, which follow dS/dt = jacobian * S + parameter_jacobian, with S = 0 at the start.
+    """
+
+    def simulate(self, whatif, p, t0, tf, h, t_eval):
+        nstates = len(whatif.x0)
+        nparams = len(p)
+
+        def f(t, y):
+            s = y[:nstates]
+            S = y[nstates:].reshape(nstates, nparams)
+            dS = whatif.jacobian(t, s, p) @ S + whatif.parameter_jacobian(t, s, p)
+            return np.concatenate((whatif.derivatives(t, s, p), dS.reshape(-1)))
+
+        y0 = np.concatenate((whatif.x0, np.zeros(nstates * nparams)))
+        sol = solve_ivp(f, (t0, tf), y0, method=RK45, max_step=h, t_eval=t_eval)
+        assert sol.success, sol.message
+        self.nfev = sol.nfev
+        # Shapes (nstates, len(t_eval)) and (nstates, nparams, len(t_eval))
+        return sol.y[:nstates], sol.y[nstates:].reshape(nstates, nparams, -1)
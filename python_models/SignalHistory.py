@@ -0,0 +1,209 @@
+import hashlib
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+from oomodelling.Model import Model
+
+
+class SignalHistory:
+    """
+    Bounded history of a few scalar signals, sampled at increasing times.
+    Only the samples needed to look back lookback seconds from the latest sample are kept.
+    The samples live in preallocated ring buffers, stored twice, so that the kept samples are always a contiguous
+    slice: appending is O(1), and the value at a past time is found by binary search.
+    The buffers grow only while lookback spans more samples than they can hold.
+    """
+
+    def __init__(self, nsignals, lookback, capacity=64):
+        self.lookback = lookback
+        self._alloc(nsignals, capacity)
+
+    def _alloc(self, nsignals, capacity):
+        self.capacity = capacity
+        self._times = np.empty(2*capacity)
+        self._values = np.empty((nsignals, 2*capacity))
+        self._next = 0
+        self._size = 0
+
+    def _window(self):
+        end = self._next + self.capacity
+        return slice(end - self._size, end)
+
+    def times(self):
+        return self._times[self._window()]
+
+    def values(self):
+        # Shape (nsignals, number of samples kept)
+        return self._values[:, self._window()]
+
+    def append(self, t, values):
+        # Samples at or after t are replaced, as when a model overrides its past state.
+        while self._size > 0 and self.times()[-1] >= t:
+            self._next = (self._next - 1) % self.capacity
+            self._size -= 1
+        if self._size == self.capacity and t - self.times()[1] < self.lookback:
+            times, old_values = self.times().copy(), self.values().copy()
+            self._alloc(len(old_values), 2*self.capacity)
+            for offset in (0, self.capacity):
+                self._times[offset:offset + len(times)] = times
+                self._values[:, offset:offset + len(times)] = old_values
+            self._next = self._size = len(times)
+        i = self._next
+        self._times[i] = self._times[i + self.capacity] = t
+        self._values[:, i] = self._values[:, i + self.capacity] = values
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def values_at(self, ts):
+        # Values of every signal at the times ts, with shape (nsignals, len(ts)).
+        # As the delayed signals of Model, the value at t is that of the last sample at or before t,
+        # or of the first sample, before it.
+        idx = np.maximum(np.searchsorted(self.times(), ts, side='right') - 1, 0)
+        return self.values()[:, idx]
+
+
+class TrackedHistory:
+    """
+    History of the tracked signals of a RecalibratingTrackingSimulator, set as its history before the simulation starts.
+    The signals are kept in a SignalHistory, and the signals of root and its submodels are trimmed
+    to the last max(horizon, lookback) seconds, so that memory stays bounded in long simulations.
+    root is the outermost model, which the solver steps, e.g., a BikeTrackingWithInputScenario.
+    When it is None, it is the simulator itself, which must then not be a submodel of another model,
+    as all the signals of a model and its submodels must have the same length.
+    lookback must cover the longest delay of any submodel, e.g., the delay of DriverKinematic.
+    When it is None, it is the horizon plus the longest delay (see longest_delay), updated at each trim,
+    as delays can be recalibrated.
+    Samples are dropped in chunks at least as large as the samples kept, so that each sample is deleted
+    in amortized constant time.
+    """
+
+    def __init__(self, lookback=None, root=None):
+        self.lookback = lookback
+        self.root = root
+        self._history = None
+        self._lookback = None
+
+    def current_lookback(self, simulator):
+        if self.lookback is None:
+            return simulator.horizon + longest_delay(simulator)
+        return max(simulator.horizon, self.lookback)
+
+    def record(self, simulator, signals):
+        # Appends the current values of signals, the tracked signals of simulator, which take a delay, as in Model.
+        root = simulator if self.root is None else self.root
+        times = root.signals['time']
+        t = simulator.time()
+        if self._history is None:
+            assert len(times) == 1, "The history is set before the simulation starts."
+            self._lookback = self.current_lookback(simulator)
+            self._history = SignalHistory(len(signals), self._lookback)
+            # The sample recorded at the start, as discrete steps only see the samples after it.
+            self._history.append(times[0], [s(times[0] - t) for s in signals])
+        self._history.append(t, [s(0.0) for s in signals])
+        dropped = bisect_left(times, t - self._lookback) - 1
+        if dropped >= len(times) - dropped:
+            trim_signals(root, t - self._lookback)
+            self._lookback = self.current_lookback(simulator)
+            self._history.lookback = self._lookback
+
+    def recorded(self):
+        return self._history is not None
+
+    def values_at(self, signals, tf, ts):
+        # Values of signals at the times ts, looked up at time tf as their delayed values s(-(tf - t)) in Model:
+        # the current value when t is close to tf, and otherwise that of the last sample at or before t.
+        delays = -(tf - np.asarray(ts))
+        values = self._history.values_at(np.maximum(tf + delays, 0.0))
+        values[:, np.isclose(delays, 0.0)] = np.array([[s(0.0)] for s in signals])
+        return values
+
+
+class WindowInterpolant:
+    """
+    Zero-order hold of the samples (times, values), as the delayed signals of Model: the value at t is that of
+    the last sample at or before t, or of the first sample, before it.
+    When the samples are evenly spaced, as they are in a fixed-step co-simulation,
+    the sample holding a scalar t is computed directly from t instead of searched for.
+    The value only jumps at the samples where it changes, so those are its breakpoints,
+    as those of the profiles in DriverProfiles, and not every sample, which would restart the solvers at each one.
+    """
+
+    def __init__(self, times, values):
+        self.times = np.asarray(times, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.breakpoints = self.times[1:][np.diff(self.values) != 0]
+        self._digest = None
+        steps = np.diff(self.times)
+        self._uniform = len(steps) > 0 and np.allclose(steps, steps[0])
+        if self._uniform:
+            self._t0 = self.times[0]
+            self._dt = steps[0]
+            self._last = len(steps)
+
+    @staticmethod
+    def from_signals(model, name, t0, tf):
+        # Interpolant of the signal recorded by model under name, over the window [t0, tf], where tf is the current
+        # time. It ends with the current value of the signal, which Model gives for a delay of 0.
+        times = model.signals['time']
+        i = max(bisect_right(times, t0) - 1, 0)
+        j = bisect_right(times, tf)
+        return WindowInterpolant(times[i:j] + [tf], model.signals[name][i:j] + [getattr(model, name)()])
+
+    def digest(self):
+        # Digest of the samples, which identifies the interpolant, e.g., in the keys of a WhatIfCache.
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.times.tobytes() + self.values.tobytes()).hexdigest()
+        return self._digest
+
+    def __call__(self, t):
+        if not self._uniform or np.ndim(t) > 0:
+            return self.values[np.maximum(np.searchsorted(self.times, t, side='right') - 1, 0)]
+        i = min(max(int((t - self._t0) / self._dt), 0), self._last)
+        # The division can round t across a sample time.
+        if i > 0 and self.times[i] > t:
+            i -= 1
+        elif i < self._last and self.times[i + 1] <= t:
+            i += 1
+        return self.values[i]
+
+
+def past_value(model, name, t):
+    # Value at time t of the signal recorded by model under name, with the sample found by binary search.
+    # As the delayed signals of Model, it is the value of the last sample at or before t, or of the first sample.
+    times = model.signals['time']
+    i = bisect_right(times, max(t, 0.0)) - 1
+    return model.signals[name][max(i, 0)]
+
+
+def longest_delay(model, visited=None):
+    # Longest delay parameter of model and of its submodels, e.g., the delay of DriverKinematic, or 0.
+    visited = set() if visited is None else visited
+    if id(model) in visited:
+        return 0.0
+    visited.add(id(model))
+    delay = getattr(model, 'delay', 0.0)
+    longest = delay if isinstance(delay, (int, float)) else 0.0
+    for value in vars(model).values():
+        if isinstance(value, Model):
+            longest = max(longest, longest_delay(value, visited))
+    return longest
+
+
+def trim_signals(model, t_min, visited=None):
+    # Drops the samples recorded before t_min from the signals of model and of its submodels.
+    # The last sample before t_min is kept, so that values at t_min can still be interpolated.
+    visited = set() if visited is None else visited
+    if id(model) in visited:
+        return
+    visited.add(id(model))
+    times = model.signals.get('time')
+    if times:
+        n = len(times)
+        k = bisect_left(times, t_min) - 1
+        if k > 0:
+            for samples in model.signals.values():
+                if isinstance(samples, list) and len(samples) == n:
+                    del samples[:k]
+    for value in vars(model).values():
+        if isinstance(value, Model):
+            trim_signals(value, t_min, visited)
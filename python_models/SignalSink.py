@@ -0,0 +1,102 @@
+from bisect import bisect_right
+
+import numpy as np
+from oomodelling.Model import Model
+
+from ColumnarResults import ColumnarWriter
+from SignalHistory import trim_signals
+
+
+class SignalSink:
+    """
+    Streams the signals recorded by a model and its submodels to a columnar results directory (see ColumnarResults),
+    and drops them from memory, except for the last lookback seconds, so that long simulations run in bounded memory.
+    The columns are 'time' and every signal, named by the path of its submodel, e.g., 'to_track.dbike.X'.
+    lookback must cover what the models read from their past, e.g., the horizon of a tracking simulator.
+    Signals are written by flush, which after_step does every flush_interval seconds of simulated time,
+    and by close, which must be called at the end.
+    A ModelStepper given the sink calls after_step at the end of each step. With ModelSolver, the model is simulated
+    through a SignalSinkModel, whose discrete steps call it.
+    The last sample is only written by close, as discrete steps may still override it.
+    root is the outermost model, whose signals are trimmed together with those of model, e.g., a SignalSinkModel,
+    as all the signals of a model and its submodels must have the same length. When it is None, it is model.
+    """
+
+    def __init__(self, model, path, lookback, flush_interval=10.0):
+        self.model = model
+        self.path = path
+        self.lookback = lookback
+        self.flush_interval = flush_interval
+        self.root = None
+        self.columns = None
+        self._writer = None
+        self._signals = None
+        self._written = -np.inf
+        self._last_flush = -np.inf
+
+    def after_step(self):
+        # Flushes when flush_interval has passed since the last flush.
+        if self.model.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def collect_signals(self, model, prefix='', visited=None):
+        # Returns the (model, prefix, signal names) of model and of its submodels.
+        visited = set() if visited is None else visited
+        if id(model) in visited:
+            return []
+        visited.add(id(model))
+        n = len(model.signals.get('time', []))
+        names = [name for name, samples in model.signals.items()
+                 if name != 'time' and isinstance(samples, list) and len(samples) == n]
+        signals = [(model, prefix, names)]
+        for attribute, value in vars(model).items():
+            if isinstance(value, Model):
+                signals += self.collect_signals(value, prefix + attribute + '.', visited)
+        return signals
+
+    def flush(self, final=False):
+        if self._writer is None:
+            self._signals = self.collect_signals(self.model)
+            self.columns = ['time'] + [prefix + name for _, prefix, names in self._signals for name in names]
+            self._writer = ColumnarWriter(self.path, self.columns)
+        times = self.model.signals['time']
+        end = len(times) if final else len(times) - 1
+        start = bisect_right(times, self._written, 0, max(end, 0))
+        if start < end:
+            rows = [np.asarray(times[start:end], dtype=float)]
+            for model, _, names in self._signals:
+                # Submodels record their samples together with the model, so they have the same times.
+                begin = bisect_right(model.signals['time'], self._written)
+                rows += [np.asarray(model.signals[name][begin:begin + end - start], dtype=float) for name in names]
+            self._writer.append_rows(np.column_stack(rows))
+            self._written = times[end - 1]
+        self._last_flush = self.model.time()
+        root = self.model if self.root is None else self.root
+        trim_signals(root, min(self.model.time() - self.lookback, self._written))
+
+    def close(self):
+        self.flush(final=True)
+        self._writer.close()
+
+
+class SignalSinkModel(Model):
+    """
+    Simulated by ModelSolver in place of the model whose signals sink streams, wrapped as its submodel:
+    each discrete step calls the after_step of sink, and then the discrete steps of the model.
+    Typical use:
+        sink = SignalSink(m, path, lookback)
+        ModelSolver().simulate(SignalSinkModel(m, sink), 0.0, stop_time, 0.1)
+        sink.close()
+    """
+
+    def __init__(self, wrapped, sink):
+        super().__init__()
+        self.wrapped = wrapped
+        self.sink = sink
+        # The signals of this model are trimmed with those of the wrapped one.
+        sink.root = self
+        self.save()
+
+    def discrete_step(self):
+        self.sink.after_step()
+        return super().discrete_step()
@@ -0,0 +1,41 @@
+import logging
+
+
+class StepLogger:
+    """
+    Logging for the hot path of co-simulation wrappers, e.g., the do_step of the BicycleTracking FMU,
+    which runs 100 times per simulated second.
+    log is the function that writes a message, e.g., Fmi2Slave.log_ok, print, or logging.getLogger(...).debug.
+    Messages have a level, as those of the logging module, and are given as a format string and its arguments, e.g.,
+    logger(logging.DEBUG, "Solution success: {}", sol.success).
+    They are only formatted and written when their level is at least level,
+    so that a disabled message costs an integer comparison.
+    The trace of each step, e.g., "DoStep at time ...", is logged with trace, at the DEBUG level.
+    When trace_every is set, only every trace_every-th step is traced, counted by begin_step,
+    to sample the steps of long simulations for diagnostics.
+    """
+
+    def __init__(self, log, level=logging.WARNING, trace_every=None):
+        self.log = log
+        self.level = level
+        self.trace_every = trace_every
+        self.steps = 0
+        self._tracing = False
+
+    def begin_step(self):
+        # Called at the start of each step. Returns whether the step is traced.
+        self._tracing = self.level <= logging.DEBUG and \
+            (self.trace_every is None or self.steps % self.trace_every == 0)
+        self.steps += 1
+        return self._tracing
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def trace(self, message, *args):
+        if self._tracing:
+            self.log(message.format(*args) if args else message)
+
+    def __call__(self, level, message, *args):
+        if level >= self.level:
+            self.log(message.format(*args) if args else message)
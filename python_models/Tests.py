@@ -1,23 +1,40 @@
 import logging
+import os
+import tempfile
 import unittest
+from functools import partial
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy.integrate import BDF, RK45, solve_ivp
 from scipy.optimize import minimize_scalar
 from random import seed
 
+from BatchSolver import solve_ivp_with_breakpoints
+from BikeDynamicModel import BikeDynamicModel
+from BikeDynamicModelSpeedDriven import BikeDynamicModelSpeedDriven
 from BikeKinematicModel import BikeKinematicModel
 from BikeKinematicModelWithDriver import BikeKinematicModelWithDriver
 from BikeModelsWithDriver import BikeModelsWithDriver
 from BikeDynamicModelWithDriver import BikeDynamicModelWithDriver
 from BikeTrackingWithDynamic import BikeTrackingSimulatorDynamic
 from BikeTrackingWithDynamicWithoutStateRestore import BikeTrackingWithDynamicWithoutStateRestore
+from ColumnarResults import ColumnarWriter, read_columns
 from DriverDynamic import DriverDynamic
+from DriverKinematic import DriverKinematic
+from FixedStepSolver import fixed_step_solve
+from FmuBundles import BUNDLED_FMUS, FMUS, rewrite, stale_files
+from ModelPool import ModelPool
+from ModelStepper import ModelStepper
 from oomodelling.ModelSolver import ModelSolver
-from BikeTrackingWithKinematic import TrackingSimulator, BikeTrackingSimulatorKinematic
+from BikeTrackingWithKinematic import TrackingSimulator, BikeTrackingSimulatorKinematic, TrackingModel
 from RobottiBikeModelsWithDriver import RobottiBikeModelsWithDriver
+from RobottiDynamicModel import RobottiDynamicModel
 from RobottiDynamicModelWithDriver import RobottiDynamicModelWithDriver
+from RobottiFleet import RobottiFleet
 from RobottiTrackingSimulator import RobottiTrackingSimulator
 from RobottiTrackingSimulatorRandomNoise import RobottiTrackingSimulatorRandomNoise
+from SignalSink import SignalSink, SignalSinkModel
+from StepLogger import StepLogger
 
 
 class TestExperiments(unittest.TestCase):
@@ -29,6 +46,16 @@ class TestExperiments(unittest.TestCase):
         plt.plot(m.signals['time'], m.signals['steering'])
         plt.show()
 
+    def test_driver_kinematic_delay(self):
+        m = DriverKinematic()
+        m.u = lambda: np.sin(m.time())
+        ModelSolver().simulate(m, 0.0, 5.0, 0.1)
+
+        # As u(-delay), the last sample at or before each time minus the delay.
+        times = np.array(m.signals['time'])
+        idx = np.maximum(np.searchsorted(times, np.maximum(times - m.delay, 0.0), side='right') - 1, 0)
+        self.assertTrue(np.allclose(m.signals['steering'], m.k*np.array(m.signals['u'])[idx]))
+
     def test_bike_model_fixed_steering(self):
         m = BikeKinematicModel()
         m.deltaf = lambda: 0.4 if m.time() > 5.0 else 0.0
@@ -184,3 +211,204 @@ class TestExperiments(unittest.TestCase):
         p2.legend()
         plt.show()
 
+    def test_compiled_derivatives(self):
+        for m in [BikeDynamicModel(), BikeDynamicModelSpeedDriven(), RobottiDynamicModel()]:
+            f = m.derivatives()
+            compiled_f = m.compile_derivatives()
+            x = m.state_vector() + np.linspace(0.1, 0.5, m.nstates())
+            self.assertTrue(np.allclose(f(0.0, x), compiled_f(0.0, x)))
+
+    def test_compiled_jacobian(self):
+        for m in [BikeDynamicModel(), BikeDynamicModelSpeedDriven(), RobottiDynamicModel()]:
+            compiled_f = m.compile_derivatives()
+            jac = m.compile_jacobian()
+            x = m.state_vector() + np.linspace(0.1, 0.5, m.nstates())
+            h = 1e-6
+            fd = np.array([(compiled_f(0.0, x + h*e) - compiled_f(0.0, x - h*e)) / (2*h) for e in np.eye(len(x))]).T
+            self.assertTrue(np.allclose(jac(0.0, x), fd, rtol=1e-4, atol=1e-4))
+
+    def test_model_stepper(self):
+        reference = BikeDynamicModel()
+        reference.deltaf = lambda: 0.1
+        sol = ModelSolver().simulate(reference, 0.0, 5.0, 0.01)
+
+        for method in [RK45, 'RK4', 'Heun']:
+            m = BikeDynamicModel()
+            m.deltaf = lambda: 0.1
+            stepper = ModelStepper(m, method)
+            for i in range(500):
+                stepper.step(i*0.01, 0.01)
+            self.assertTrue(np.allclose(m.state_vector(), sol.y[:, -1], rtol=1e-3, atol=1e-3))
+
+    def test_model_stepper_jacobian(self):
+        # Implicit methods use the analytic Jacobian of the model, with the input as it is when it is evaluated.
+        reference = BikeDynamicModel()
+        reference.deltaf = lambda: 0.1
+        sol = ModelSolver().simulate(reference, 0.0, 5.0, 0.01)
+
+        m = BikeDynamicModel()
+        m.deltaf = lambda: 0.1
+        compiled = []
+        compile_jacobian = m.compile_jacobian
+        m.compile_jacobian = lambda: compiled.append(m.time()) or compile_jacobian()
+        stepper = ModelStepper(m, BDF)
+        for i in range(500):
+            stepper.step(i*0.01, 0.01)
+        self.assertGreater(len(compiled), 0)
+        self.assertTrue(np.allclose(m.state_vector(), sol.y[:, -1], rtol=1e-3, atol=1e-3))
+
+    def test_model_stepper_held_input(self):
+        # The input changes at every step, so the derivative reused from the end of the previous step is stale.
+        def bike():
+            m = BikeKinematicModel()
+            held = [0.0]
+            m.deltaf = lambda: held[0]
+            return m, held
+
+        m, held = bike()
+        stepper = ModelStepper(m, partial(RK45, rtol=1e-9, atol=1e-9))
+        reference, reference_held = bike()
+        x = reference.state_vector()
+        for i in range(50):
+            held[0] = reference_held[0] = 0.1*(-1)**i
+            stepper.step(i*0.1, 0.1)
+            x = solve_ivp(reference.derivatives(), (i*0.1, (i+1)*0.1), x, rtol=1e-11, atol=1e-11).y[:, -1]
+        self.assertTrue(np.allclose(m.state_vector(), x, rtol=1e-8, atol=1e-8))
+
+    def test_robotti_fleet(self):
+        cafs = np.array([2000.0, 20000.0])
+        fleet = RobottiFleet(len(cafs), mu=0.5)
+        fleet.Caf = lambda t: cafs
+        fleet.deltaFl = lambda t: 0.2
+        fleet.deltaFr = lambda t: 0.2
+        fleet.simulate(5.0, 0.01)
+
+        for i, caf in enumerate(cafs):
+            m = RobottiDynamicModel()
+            m.mu = 0.5
+            m.Caf = lambda: caf
+            m.deltaFl = lambda: 0.2
+            m.deltaFr = lambda: 0.2
+            sol = ModelSolver().simulate(m, 0.0, 5.0, 0.01)
+            self.assertTrue(np.allclose(fleet.state('X')[i], sol.y[m.get_state_idx('X'), -1], atol=1e-2))
+            self.assertTrue(np.allclose(fleet.state('Y')[i], sol.y[m.get_state_idx('Y'), -1], atol=1e-2))
+
+    def test_step_logger(self):
+        messages = []
+        logger = StepLogger(messages.append, level=logging.DEBUG, trace_every=100)
+        m = BikeDynamicModel()
+        m.deltaf = lambda: 0.1
+        stepper = ModelStepper(m, logger=logger)
+        for i in range(500):
+            stepper.step(i*0.01, 0.01)
+        # Only every 100th step is traced, and the integrator is only restarted at the first step.
+        self.assertEqual(len(messages), 6)
+        self.assertEqual(messages[0], "Step from 0.0 to 0.01.")
+        self.assertEqual(messages[1], "Restarting the integrator at 0.0.")
+        self.assertTrue(all(message.startswith("Step from") for message in messages[2:]))
+
+        x = m.state_vector()
+        x[m.get_state_idx('vy')] += 1.0
+        m.record_state(x, m.time(), override=True)
+        stepper.step(5.0, 0.01)
+        self.assertEqual(messages[-1], "Restarting the integrator at 5.0.")
+
+        # Above the DEBUG level, nothing is written.
+        logger.level = logging.INFO
+        x = m.state_vector()
+        x[m.get_state_idx('vy')] += 1.0
+        m.record_state(x, m.time(), override=True)
+        for i in range(200):
+            stepper.step(5.01 + i*0.01, 0.01)
+        self.assertEqual(messages[-1], "Restarting the integrator at 5.0.")
+
+    def test_columnar_results(self):
+        path = os.path.join(tempfile.mkdtemp(), 'results.cols')
+        names = ['time', '{bd}.bdi.X']
+        with ColumnarWriter(path, names, chunk_rows=4) as writer:
+            for t in np.arange(10):
+                writer.append([t, 2*t])
+            # Only the full chunks are written until the writer is flushed.
+            self.assertEqual(len(read_columns(path)['time']), 8)
+        columns = read_columns(path)
+        self.assertEqual(list(columns.keys()), names)
+        self.assertTrue(np.array_equal(columns['{bd}.bdi.X'], 2*np.arange(10)))
+
+    def test_signal_sink(self):
+        reference = BikeDynamicModelWithDriver()
+        stepper = ModelStepper(reference)
+        for i in range(200):
+            stepper.step(i*0.1, 0.1)
+            reference.discrete_step()
+
+        path = os.path.join(tempfile.mkdtemp(), 'signals.cols')
+        m = BikeDynamicModelWithDriver()
+        sink = SignalSink(m, path, lookback=2.0, flush_interval=1.0)
+        stepper = ModelStepper(m, sink=sink)
+        for i in range(200):
+            stepper.step(i*0.1, 0.1)
+            m.discrete_step()
+        # Only the look-back window, and the samples since the last flush, are kept in memory.
+        self.assertLess(m.dbike.signals['time'][-1] - m.dbike.signals['time'][0], 4.0)
+        sink.close()
+
+        columns = read_columns(path)
+        self.assertTrue(np.allclose(columns['time'], reference.signals['time']))
+        self.assertTrue(np.allclose(columns['dbike.X'], reference.dbike.signals['X']))
+        self.assertTrue(np.allclose(columns['ddriver.steering'], reference.ddriver.signals['steering']))
+
+        # Through ModelSolver, the sink is flushed at the discrete steps of a SignalSinkModel.
+        # The wrapper changes the steps of the solver, so the reference is wrapped too, and keeps all its signals.
+        reference = BikeDynamicModelWithDriver()
+        unbounded = SignalSink(reference, os.path.join(tempfile.mkdtemp(), 'signals.cols'), lookback=np.inf)
+        ModelSolver().simulate(SignalSinkModel(reference, unbounded), 0.0, 20.0, 0.1)
+        path = os.path.join(tempfile.mkdtemp(), 'signals.cols')
+        m = BikeDynamicModelWithDriver()
+        sink = SignalSink(m, path, lookback=2.0, flush_interval=1.0)
+        ModelSolver().simulate(SignalSinkModel(m, sink), 0.0, 20.0, 0.1)
+        self.assertLess(m.dbike.signals['time'][-1] - m.dbike.signals['time'][0], 4.0)
+        sink.close()
+        columns = read_columns(path)
+        self.assertTrue(np.allclose(columns['time'], reference.signals['time']))
+        self.assertTrue(np.allclose(columns['dbike.X'], reference.dbike.signals['X']))
+
+    def test_driver_profile(self):
+        m = DriverDynamic()
+        ModelSolver().simulate(m, 0.0, 30.0, 0.1)
+        profile = m.profile()
+        # The profile is pure, so it can be evaluated at all recorded times at once, after the simulation.
+        self.assertTrue(np.allclose(profile(np.array(m.signals['time'])), m.signals['steering']))
+
+        # Stopping at the breakpoints, the integral of the steering is exact, even with huge steps.
+        ys = solve_ivp_with_breakpoints(lambda t, x: [profile(t)], 0.0, 30.0, np.zeros(1), [30.0],
+                                        profile.breakpoints, max_step=30.0)
+        area = m.nperiods * m.amplitude * (m.risingtime + m.width)
+        self.assertTrue(np.isclose(ys[0, -1], area))
+        ys = fixed_step_solve('RK4', lambda t, x: profile(t), 0.0, np.zeros(1), [30.0], 30.0, profile.breakpoints)
+        self.assertTrue(np.isclose(ys[0, -1], area))
+
+    def test_fmu_bundles(self):
+        # Only the imports of the bundled modules go through thirdparty.
+        self.assertEqual(rewrite("from A import a\r\n    from B import b\r\nfrom numpy import c\r\n", {'A', 'B'}),
+                         "from thirdparty.A import a\r\n    from thirdparty.B import b\r\nfrom numpy import c\r\n")
+        # The modules bundled in the FMUs are those of python_models, up to that rewrite: run FmuBundles otherwise.
+        for name in BUNDLED_FMUS:
+            self.assertEqual(stale_files(os.path.join(FMUS, name)), [], name)
+
+    def test_model_pool(self):
+        pool = ModelPool(TrackingModel)
+        m = pool.get({'kdriver.delay': 0.5, 'kbike.x': 1.0})
+        ModelSolver().simulate(m, 0.0, 1.0, 0.1)
+        pool.put(m)
+
+        # The same model is given back, reset to its initial states and with no signals, so it can be simulated again.
+        reused = pool.get({'kbike.y': 2.0})
+        self.assertIs(reused, m)
+        self.assertEqual(pool.created, 1)
+        self.assertEqual(reused.kbike.x(), 0.0)
+        self.assertEqual(reused.kbike.y(), 2.0)
+        self.assertEqual(reused.kdriver.delay, 0.5)
+        self.assertEqual(len(reused.signals['time']), 0)
+        ModelSolver().simulate(reused, 0.0, 1.0, 0.1)
+        self.assertIsNot(pool.get(), m)
+        self.assertEqual(pool.created, 2)
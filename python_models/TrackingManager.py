@@ -0,0 +1,37 @@
+from oomodelling.Model import Model
+
+
+class TrackingManager(Model):
+    """
+    Tracks many targets at once, each with its own RecalibratingTrackingSimulator, e.g., BikeTrackingWithInput.
+    The trackers are submodels of the manager, so they are all stepped together by a single solver.
+    Recalibrations are scheduled by the manager instead of by each tracker: at each step, at most max_recalibrations
+    of the trackers that need one are recalibrated, those with the largest error to tolerance ratio first.
+    The others wait for a later step, as long as they still need a recalibration then.
+    Every tracker must have a recalibration_search.
+    """
+
+    def __init__(self, trackers, max_recalibrations=1):
+        super().__init__()
+        self.trackers = list(trackers)
+        for i, tracker in enumerate(self.trackers):
+            assert tracker.recalibration_search is not None, "Tracker {} has no recalibration_search.".format(i)
+            tracker.recalibration_scheduler = self
+            setattr(self, 'tracker{}'.format(i), tracker)
+        self.max_recalibrations = max_recalibrations
+        self._pending = []
+        self.save()
+
+    def request_recalibration(self, tracker):
+        if tracker not in self._pending:
+            self._pending.append(tracker)
+
+    def discrete_step(self):
+        updated = super().discrete_step()
+        pending = [tracker for tracker in self._pending if tracker.needs_recalibration()]
+        pending.sort(key=lambda tracker: tracker.error() / tracker.tolerance, reverse=True)
+        for tracker in pending[:self.max_recalibrations]:
+            tracker.recalibrate_with_search()
+            updated = True
+        self._pending = pending[self.max_recalibrations:]
+        return updated
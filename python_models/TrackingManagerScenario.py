@@ -0,0 +1,30 @@
+from oomodelling.Model import Model
+
+from BikeDynamicModelWithDriver import BikeDynamicModelWithDriver
+from BikeTrackingWithInput import BikeTrackingWithInput
+from SensitivitySearch import SensitivitySearch
+from TrackingManager import TrackingManager
+
+
+class TrackingManagerScenario(Model):
+    def __init__(self, ntargets=3, max_recalibrations=1):
+        super().__init__()
+
+        self.targets = []
+        trackers = []
+        for i in range(ntargets):
+            target = BikeDynamicModelWithDriver()
+            # Each target changes its Caf by a different amount, at the same time.
+            target.dbike.Caf = lambda i=i: 800 if self.time() < 10.0 else 500 - 100*i
+            tracker = BikeTrackingWithInput()
+            tracker.recalibration_search = SensitivitySearch()
+            tracker.to_track_X = target.dbike.X
+            tracker.to_track_Y = target.dbike.Y
+            tracker.to_track_delta = target.ddriver.steering
+            setattr(self, 'target{}'.format(i), target)
+            self.targets.append(target)
+            trackers.append(tracker)
+
+        self.manager = TrackingManager(trackers, max_recalibrations)
+
+        self.save()
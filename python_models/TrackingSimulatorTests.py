@@ -1,10 +1,15 @@
+import io
+import json
 import logging
+import os
 import unittest
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import minimize_scalar
 from random import seed
 
+from BackgroundRecalibration import BackgroundRecalibration
+from BatchGridSearch import BatchGridSearch
 from BikeKinematicModel import BikeKinematicModel
 from BikeKinematicModelWithDriver import BikeKinematicModelWithDriver
 from BikeModelsWithDriver import BikeModelsWithDriver
@@ -12,16 +17,81 @@ from BikeDynamicModelWithDriver import BikeDynamicModelWithDriver
 from BikeTrackingWithDynamic import BikeTrackingSimulatorDynamic
 from BikeTrackingWithDynamicWithoutStateRestore import BikeTrackingWithDynamicWithoutStateRestore
 from BikeTrackingWithInputScenario import BikeTrackingWithInputScenario
+from CoSimulationMaster import CoSimulationMaster
 from DriverDynamic import DriverDynamic
 from oomodelling.ModelSolver import ModelSolver
 from BikeTrackingWithKinematic import TrackingSimulator, BikeTrackingSimulatorKinematic
+from MultiFidelitySearch import MultiFidelitySearch
+from NelderMeadSearch import NelderMeadSearch
+from ParameterSweep import grid, sweep
+from RecalibrationExporter import RecalibrationExporter
+from RecalibratingTrackingSimulator import SearchResult
 from RobottiBikeModelsWithDriver import RobottiBikeModelsWithDriver
 from RobottiDynamicModelWithDriver import RobottiDynamicModelWithDriver
 from RobottiTrackingSimulator import RobottiTrackingSimulator
 from RobottiTrackingSimulatorRandomNoise import RobottiTrackingSimulatorRandomNoise
+from SensitivitySearch import SensitivitySearch
+from SignalHistory import TrackedHistory, WindowInterpolant
+from TrackingManagerScenario import TrackingManagerScenario
+from WhatIfCache import WhatIfCache
+from WhatIfEvaluator import WhatIfEvaluator, trajectory_cost
+
+class SquareWhatIf:
+    # A simulator with a single tracked sample, p^2, whose linearization at p is minimal far from the true minimum, at 1.
+    conv_xatol = 1e-6
+    conv_fatol = 0.1
+    max_iterations = 20
+
+    def run_whatif_sensitivity(self, parameters, t0, tf, tracked_solutions, error_space):
+        return np.array([[parameters[0]**2]]), np.array([[[2*parameters[0]]]])
+
+    def evaluate_candidate(self, parameters, t0, tf, tracked_solutions, error_space, bound=None):
+        return self.evaluate_candidates([parameters], t0, tf, tracked_solutions, error_space)[0]
+
+    def evaluate_candidates(self, candidates, t0, tf, tracked_solutions, error_space, bound=None):
+        return trajectory_cost(np.asarray(candidates)[:, :, None]**2, tracked_solutions)
+
+
+class HeldInputWindow:
+    # A what-if window from rest, whose single input holds the given values from 0 and 0.5.
+    time_step = 0.1
+
+    def __init__(self, values):
+        self.steering = WindowInterpolant([0.0, 0.5], values)
+
+    def whatif_state(self, t0, tf):
+        return np.zeros(3)
+
+    def whatif_inputs(self, t0, tf):
+        return [self.steering]
+
 
 class TrackingSimulatorTests(unittest.TestCase):
 
+    def simulate_window(self, history=None, **parameters):
+        # A dynamic bicycle tracked for 15s, without recalibrations, with the given history and parameters,
+        # and the what-if window of its last 5s, as (m, t0, tf, tracked_solutions, error_space).
+        # The tracked solutions, which the history gives when set, are checked against the delayed signals of Model.
+        seed(1)
+        m = BikeTrackingSimulatorDynamic()
+        m.tolerance = 1e10
+        m.horizon = 5.0
+        m.time_step = 0.1
+        m.history = history
+        for name, value in parameters.items():
+            setattr(m, name, value)
+        m.to_track.ddriver.nperiods = 2
+
+        ModelSolver().simulate(m, 0.0, 15.0, 0.1)
+
+        tf = m.time()
+        t0 = tf - m.horizon
+        error_space = np.linspace(t0, tf, 10)
+        tracked_solutions = m.tracked_solutions(tf, error_space)
+        delayed = [[s(-(tf - t)) for t in error_space] for s in (m.to_track.dbike.X, m.to_track.dbike.Y)]
+        self.assertTrue(np.array_equal(tracked_solutions, delayed))
+        return m, t0, tf, tracked_solutions, error_space
+
     def test_tracking_kinematic(self):
         m = BikeTrackingSimulatorKinematic()
         m.tolerance = 10
@@ -85,6 +155,250 @@ class TrackingSimulatorTests(unittest.TestCase):
         plt.show()
 
 
+    def test_whatif_batch_matches_serial(self):
+        # The serial what-if simulations check the window against the signals, as recorded by the history.
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window(TrackedHistory())
+        candidates = np.array([[500.0], [800.0], [1100.0]])
+        batch = m.run_whatif_batch(candidates, t0, tf, tracked_solutions, error_space)
+        for i in range(len(candidates)):
+            serial = m.run_whatif_simulation(candidates[i], t0, tf, tracked_solutions, error_space)
+            self.assertTrue(np.allclose(batch[i], serial, atol=1e-2))
+
+        m.whatif_evaluator = WhatIfEvaluator(processes=2)
+        parallel = m.run_whatif_batch(candidates, t0, tf, tracked_solutions, error_space)
+        m.close_whatif_pool()
+        self.assertTrue(np.allclose(batch, parallel, atol=1e-2))
+
+    def test_whatif_cache(self):
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window(TrackedHistory())
+        cache = WhatIfCache(resolution=1e-3)
+        m.whatif_cache = cache
+        simulations = m.stats.whatif_simulations
+        first = m.evaluate_candidate(np.array([800.0]), t0, tf, tracked_solutions, error_space)
+        # Parameters that only differ below the resolution are not simulated again.
+        again = m.evaluate_candidate(np.array([800.0001]), t0, tf, tracked_solutions, error_space)
+        self.assertEqual(first, again)
+        m.evaluate_candidate(np.array([801.0]), t0, tf, tracked_solutions, error_space)
+        self.assertEqual(m.stats.whatif_simulations, simulations + 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # Batches, with or without early abort, and sensitivities are looked up as well.
+        candidates = np.array([[790.0], [800.0], [810.0]])
+        costs = m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space)
+        sensitivities = m.run_whatif_sensitivity(np.array([800.0]), t0, tf, tracked_solutions, error_space)[1]
+        simulations = m.stats.whatif_simulations
+        self.assertTrue(np.array_equal(m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space),
+                                       costs))
+        m.whatif_evaluator.early_abort = True
+        self.assertTrue(np.array_equal(m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space,
+                                                             bound=costs.min()), costs))
+        again = m.run_whatif_sensitivity(np.array([800.0001]), t0, tf, tracked_solutions, error_space)[1]
+        self.assertTrue(np.array_equal(sensitivities, again))
+        self.assertEqual(m.stats.whatif_simulations, simulations)
+
+        # The least recently used trajectories are dropped to stay within max_bytes.
+        cache.max_bytes = np.asarray(tracked_solutions).nbytes
+        m.evaluate_candidate(np.array([802.0]), t0, tf, tracked_solutions, error_space)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+        # Windows from the same state, but with other inputs, e.g., of another driver, are told apart.
+        def window(simulator):
+            return WhatIfCache.window(simulator, 0.0, 1.0, error_space, 'batch')
+        self.assertEqual(window(HeldInputWindow([0.0, 0.1])), window(HeldInputWindow([0.0, 0.1])))
+        self.assertNotEqual(window(HeldInputWindow([0.0, 0.1])), window(HeldInputWindow([0.0, 0.2])))
+        # Inputs that are not recorded tables cannot be told apart, so they are not cached.
+        unrecorded = HeldInputWindow([0.0, 0.1])
+        unrecorded.steering = lambda t: 0.1
+        self.assertIsNone(window(unrecorded))
+
+    def test_early_abort(self):
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window()
+        candidates = np.array([[200.0], [800.0], [5000.0]])
+        costs = m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space)
+        best = np.argmin(costs)
+        worst = np.argmax(costs)
+
+        m.whatif_evaluator.early_abort = True
+        bounded = m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space, bound=costs[best])
+        # The best candidate is simulated to the end, and the others are abandoned once above its cost.
+        self.assertTrue(np.isclose(bounded[best], costs[best]))
+        for i in range(len(candidates)):
+            if i != best:
+                self.assertGreater(bounded[i], costs[best])
+                self.assertLessEqual(bounded[i], costs[i])
+
+        # The candidates that are not abandoned are integrated as without early abort, to the same costs.
+        bound = np.sort(costs)[1]
+        bounded = m.evaluate_candidates(candidates, t0, tf, tracked_solutions, error_space, bound=bound)
+        kept = bounded <= bound
+        self.assertEqual(kept.sum(), 2)
+        self.assertTrue(np.allclose(bounded[kept], costs[kept], rtol=1e-12, atol=0.0))
+
+        rhs_evaluations = m.stats.rhs_evaluations
+        m.evaluate_candidate(candidates[worst], t0, tf, tracked_solutions, error_space, bound=costs[best])
+        abandoned = m.stats.rhs_evaluations - rhs_evaluations
+        rhs_evaluations = m.stats.rhs_evaluations
+        m.evaluate_candidate(candidates[worst], t0, tf, tracked_solutions, error_space, bound=np.inf)
+        self.assertLess(abandoned, m.stats.rhs_evaluations - rhs_evaluations)
+
+    def test_early_abort_fixed_step(self):
+        # Without a bound to abandon candidates, simulate_costs steps the window as simulate_batch does,
+        # with the stable step estimated once.
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window()
+        whatif = m.whatif_flat(t0, tf)
+        candidates = np.array([[200.0], [800.0], [5000.0]])
+        nfev = whatif.nfev
+        trajectories = whatif.simulate_batch(candidates, t0, tf, m.time_step, error_space, 'RK4')
+        batch_nfev = whatif.nfev - nfev
+        nfev = whatif.nfev
+        costs = whatif.simulate_costs(candidates, t0, tf, m.time_step, error_space, tracked_solutions, np.inf, 'RK4')
+        self.assertEqual(whatif.nfev - nfev, batch_nfev)
+        self.assertTrue(np.allclose(costs, trajectory_cost(trajectories, tracked_solutions)))
+
+    def test_whatif_sensitivity(self):
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window()
+        caf, dcaf = 800.0, 1.0
+        trajectories, sensitivities = m.run_whatif_sensitivity(np.array([caf]), t0, tf, tracked_solutions, error_space)
+        after = m.run_whatif_batch(np.array([[caf + dcaf]]), t0, tf, tracked_solutions, error_space)[0]
+        before = m.run_whatif_batch(np.array([[caf - dcaf]]), t0, tf, tracked_solutions, error_space)[0]
+        self.assertTrue(np.allclose(sensitivities[:, 0, :], (after - before) / (2*dcaf), atol=1e-3))
+
+    def test_multifidelity_search(self):
+        seed(1)
+        m = RobottiTrackingSimulatorRandomNoise()
+        m.driver.width = 8.0
+        m.driver.nperiods = 2
+        m.robot.Caf = lambda: 30000.0
+        m.tolerance = 1e10
+        m.horizon = 5.0
+        m.time_step = 0.1
+        m.max_iterations = 20
+        m.conv_xatol = 10.0
+        m.conv_fatol = 1e-5
+
+        ModelSolver().simulate(m, 0.0, 15.0, 0.1)
+
+        tf = m.time()
+        t0 = tf - m.horizon
+        error_space = np.linspace(t0, tf, 20)
+        tracked_solutions = m.tracked_solutions(tf, error_space)
+        guess = m.get_parameter_guess()
+
+        simulations = m.stats.whatif_simulations
+        grid = BatchGridSearch().search(m, guess, t0, tf, tracked_solutions, error_space)
+        grid_simulations = m.stats.whatif_simulations - simulations
+
+        m.whatif_evaluator.early_abort = True
+        simulations = m.stats.whatif_simulations
+        result = MultiFidelitySearch().search(m, guess, t0, tf, tracked_solutions, error_space)
+        # Most candidates are only screened on the surrogate, and never simulated.
+        self.assertLess(m.stats.whatif_simulations - simulations, grid_simulations)
+        self.assertLess(result.cost, result.initial_cost)
+        # Both stop in the same flat valley, where their costs differ by less than their resolution.
+        self.assertLess(result.cost, 1.01 * grid.cost)
+
+    def test_multifidelity_search_offset_surrogate(self):
+        # The first grid, around 0.2, improves the cost by less than conv_fatol, while its spacing is still large.
+        result = MultiFidelitySearch().search(SquareWhatIf(), np.array([0.2]), 0.0, 1.0, [[1.0]], [1.0])
+        self.assertTrue(np.isclose(result.parameters[0], 1.0, atol=1e-4))
+
+    def test_grid_search_initial_cost(self):
+        for batch_size in [15, 16]:
+            result = BatchGridSearch(batch_size).search(SquareWhatIf(), np.array([0.3]), 0.0, 1.0, [[1.0]], [1.0])
+            # The guess is not on the first grid when its size is even.
+            self.assertEqual(result.initial_cost, trajectory_cost(np.array([[[0.3**2]]]), [[1.0]])[0])
+
+    def test_nelder_mead_max_iterations(self):
+        # Reaching max_iterations is not an error: the best point found so far is the result.
+        simulator = SquareWhatIf()
+        simulator.max_iterations = 2
+        result = NelderMeadSearch().search(simulator, np.array([0.2]), 0.0, 1.0, [[1.0]], [1.0])
+        self.assertEqual(result.iterations, 2)
+        self.assertLess(result.cost, trajectory_cost(np.array([[[0.2**2]]]), [[1.0]])[0])
+
+    def test_warm_start_step_change(self):
+        m, t0, tf, tracked_solutions, error_space = self.simulate_window(max_iterations=20, conv_xatol=1.0,
+                                                                         conv_fatol=1e-6)
+        for search in [BatchGridSearch(), MultiFidelitySearch()]:
+            cold = search.search(m, m.get_parameter_guess(), t0, tf, tracked_solutions, error_space)
+            # The previous search converged without moving the parameters, and then they changed by 60%.
+            converged = SearchResult(cold.parameters, cold.cost, cold.iterations, state=np.zeros(1))
+            warm = search.search(m, 1.6 * cold.parameters, t0, tf, tracked_solutions, error_space,
+                                 warm_start=converged)
+            self.assertTrue(np.allclose(warm.parameters, cold.parameters, rtol=1e-2))
+            # Both converge once their costs improve by less than conv_fatol.
+            self.assertLess(abs(warm.cost - cold.cost), m.conv_fatol)
+
+    def test_bounded_history(self):
+        ms = []
+        for bounded in [False, True]:
+            seed(1)
+            m = BikeTrackingSimulatorDynamic()
+            m.tolerance = 1e10
+            m.horizon = 5.0
+            if bounded:
+                m.history = TrackedHistory()
+            m.to_track.ddriver.nperiods = 2
+            ModelSolver().simulate(m, 0.0, 40.0, 0.1)
+            ms.append(m)
+
+        full, bounded = ms
+        tf = full.time()
+        t0 = tf - full.horizon
+        error_space = np.linspace(t0, tf, 10)
+        tracked_solutions = bounded.tracked_solutions(tf, error_space)
+        self.assertTrue(np.array_equal(full.tracked_solutions(tf, error_space), tracked_solutions))
+        # The what-if simulations start from the same samples as the history.
+        bounded.evaluate_candidate(bounded.get_parameter_guess(), t0, tf, tracked_solutions, error_space)
+        # The dynamic bicycle has no delays, so the history is bounded by the horizon.
+        self.assertLess(len(bounded.to_track.dbike.signals['time']), 2 * 5.0 / 0.1 + 2)
+
+        m = BikeTrackingSimulatorKinematic()
+        m.horizon = 5.0
+        m.tracking.kdriver.delay = 0.5
+        self.assertEqual(TrackedHistory().current_lookback(m), 5.5)
+
+    def test_bounded_history_nested(self):
+        # The tracking simulator is a submodel of the scenario, and its tracked signals are its inputs.
+        m = BikeTrackingWithInputScenario()
+        m.Caf_step_time = 5.0
+        m.tracking.recalibration_search = SensitivitySearch()
+        m.tracking.history = TrackedHistory(root=m)
+        m.tracking.tolerance = 0.2
+        m.tracking.horizon = 2.0
+        m.tracking.cooldown = 2.0
+        m.tracking.conv_xatol = 1.0
+        m.tracking.conv_fatol = 1e-3
+        m.to_track.ddriver.nperiods = 2
+
+        ModelSolver().simulate(m, 0.0, 10.0, 0.1)
+
+        self.assertGreater(len(m.tracking.recalibration_history), 0)
+        self.assertLess(len(m.signals['time']), 2 * 2.0 / 0.1 + 2)
+        self.assertEqual(len(m.to_track.dbike.signals['time']), len(m.signals['time']))
+
+    def test_past_signal(self):
+        m, t0, tf, _, _ = self.simulate_window(TrackedHistory())
+        steering = m.past_signal(m.to_track.ddriver, 'steering', t0, tf)
+        for t in np.linspace(t0, tf, 37):
+            self.assertAlmostEqual(steering(t), m.to_track.ddriver.steering(-(tf - t)))
+        # The table is built once per window, and shared by the what-if simulations of the window.
+        self.assertIs(m.past_signal(m.to_track.ddriver, 'steering', t0, tf), steering)
+        self.assertIs(m.whatif_flat(t0, tf).deltaf, steering)
+        self.assertIsNot(m.past_signal(m.to_track.ddriver, 'steering', t0 + 1.0, tf), steering)
+        m.discrete_step()
+        self.assertIsNot(m.past_signal(m.to_track.ddriver, 'steering', t0, tf), steering)
+
+        # Evenly spaced samples, whose sample is computed from t, are held as well.
+        held = WindowInterpolant(0.5*np.arange(4), [1.0, 2.0, 3.0, 4.0])
+        ts = [-1.0, 0.0, 0.5, 0.75, 1.5 - 1e-12, 1.5, 3.0]
+        self.assertEqual([held(t) for t in ts], [1.0, 1.0, 2.0, 2.0, 3.0, 4.0, 4.0])
+        self.assertEqual(list(held(np.array(ts))), [1.0, 1.0, 2.0, 2.0, 3.0, 4.0, 4.0])
+        # Only the samples where the value changes are breakpoints.
+        self.assertEqual(list(held.breakpoints), [0.5, 1.0, 1.5])
+        self.assertEqual(list(WindowInterpolant(0.5*np.arange(4), [1.0, 1.0, 2.0, 2.0]).breakpoints), [1.0])
+
     def test_generate_paper_figure(self):
         m = BikeTrackingWithDynamicWithoutStateRestore()
         m.tolerance = 0.2
@@ -233,4 +547,105 @@ class TrackingSimulatorTests(unittest.TestCase):
         p4.legend()
         plt.show()
 
+    def test_tracking_manager(self):
+        m = TrackingManagerScenario(ntargets=3, max_recalibrations=1)
+        for tracker, target in zip(m.manager.trackers, m.targets):
+            tracker.tolerance = 0.2
+            tracker.horizon = 5.0
+            tracker.cooldown = 5.0
+            tracker.nsamples = 10
+            tracker.max_iterations = 20
+            tracker.time_step = 0.1
+            tracker.conv_xatol = 1.0
+            tracker.conv_fatol = 0.01
+            target.ddriver.nperiods = 2
+
+        ModelSolver().simulate(m, 0.0, 25.0, 0.1)
+
+        times = [r.time for tracker in m.manager.trackers for r in tracker.recalibration_history]
+        for tracker in m.manager.trackers:
+            self.assertGreater(len(tracker.recalibration_history), 0)
+        # At most one recalibration per step.
+        self.assertEqual(len(times), len(set(times)))
+
+    def test_background_recalibration(self):
+        seed(1)
+        m = BikeTrackingSimulatorDynamic()
+        m.recalibration_search = SensitivitySearch()
+        m.background_recalibration = BackgroundRecalibration()
+        m.tolerance = 0.02
+        m.horizon = 5.0
+        m.cooldown = 5.0
+        m.nsamples = 10
+        m.time_step = 0.1
+        m.conv_xatol = 1.0
+        m.conv_fatol = 1e-3
+        m.to_track.ddriver.nperiods = 2
+
+        ModelSolver().simulate(m, 0.0, 30.0, 0.1)
+        m.background_recalibration.stop()
+
+        self.assertGreater(len(m.recalibration_history), 0)
+        for r in m.recalibration_history:
+            # The what-if simulation of the new parameters catches up with the time the result was applied.
+            self.assertGreaterEqual(r.ts[-1], r.time)
+            # The search and that simulation, not the steps taken while the search ran.
+            self.assertGreater(r.wall_time, 0.0)
+
+    def test_recalibration_records(self):
+        seed(1)
+        m = BikeTrackingSimulatorDynamic()
+        m.recalibration_search = SensitivitySearch()
+        m.tolerance = 0.02
+        m.horizon = 5.0
+        m.cooldown = 5.0
+        m.nsamples = 10
+        m.time_step = 0.1
+        m.conv_xatol = 1.0
+        m.conv_fatol = 1e-3
+        m.to_track.ddriver.nperiods = 2
+        stream = io.StringIO()
+        m.recalibration_callback = RecalibrationExporter(stream, simulator='dynamic')
+
+        ModelSolver().simulate(m, 0.0, 30.0, 0.1)
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(lines), len(m.recalibration_history))
+        self.assertGreater(len(lines), 0)
+        for r, line in zip(m.recalibration_history, lines):
+            self.assertEqual(line['simulator'], 'dynamic')
+            self.assertEqual(r.horizon, 5.0)
+            self.assertGreater(r.error, m.tolerance)
+            self.assertLessEqual(r.cost, r.initial_cost)
+            # One simulation per iteration and the first guess, and the one the tracking model restarts from.
+            self.assertEqual(r.whatif_simulations, r.iterations + 2)
+            self.assertGreater(r.rhs_evaluations, r.whatif_simulations)
+            self.assertGreater(r.wall_time, 0.0)
+        self.assertEqual(m.stats.whatif_simulations, sum(r.whatif_simulations for r in m.recalibration_history))
+
+    def test_cosimulation_master(self):
+        config = os.path.join(os.path.dirname(__file__), '..', 'reproduce_package', 'TrackingSimulator.json')
+        master = CoSimulationMaster.from_file(config)
+        results = master.simulate(0.0, 25.0)
+
+        self.assertEqual(len(results['time']), 2501)
+        self.assertEqual(set(results.keys()), {'time'} | set(master.logged))
+        # The tracking model follows the dynamic model, and recalibrates Caf after the drop at 10s.
+        self.assertGreater(np.abs(results['{bd}.bdi.Y']).max(), 1.0)
+        self.assertLess(results['{track}.tracki.Caf'][-1], 800.0)
+        # The tracking slave has the diagnostics outputs of the FMU, which can be logged as well.
+        tracking = master.slaves['{track}.tracki']
+        self.assertEqual(tracking.outputs['recalibrations'](), len(tracking.model.recalibration_history))
+        self.assertGreater(tracking.outputs['recalibration_whatif_simulations'](), 0.0)
+
+    def test_parameter_sweep(self):
+        points = grid(tolerance=[0.2, 1e3], Caf_after=[500.0])
+        rows = sweep(points, stop_time=15.0, processes=2)
 
+        self.assertEqual([row['tolerance'] for row in rows], [0.2, 1e3])
+        self.assertGreater(rows[0]['recalibrations'], 0)
+        # Nothing is recalibrated when the tolerance is never exceeded.
+        self.assertEqual(rows[1]['recalibrations'], 0)
+        self.assertGreater(rows[1]['final_error'], rows[0]['final_error'])
+        for row in rows:
+            self.assertGreater(row['wall_time'], 0.0)
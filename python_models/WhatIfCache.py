@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from SignalHistory import WindowInterpolant
+
+
+class WhatIfCache:
+    """
+    Least recently used cache of what-if trajectories, set as the whatif_cache of a RecalibratingTrackingSimulator.
+    Its WhatIfEvaluator looks every candidate up here before simulating it, whether alone, in a batch,
+    with early abort, or with its sensitivities.
+    Entries are keyed by the what-if window, the initial state of the what-if model (see whatif_state),
+    the digests of the recorded inputs it is simulated with (see whatif_inputs and WindowInterpolant.digest),
+    the parameters, rounded to multiples of resolution, and the settings that affect the result,
+    such as time_step and the integration method, so that searches that probe the same parameters again,
+    e.g., when they bracket or check convergence, and windows that are simulated again, e.g., by another simulator,
+    do not simulate them twice.
+    resolution is absolute, and can be given per parameter.
+    The cached trajectories take at most max_bytes, and the least recently used ones are dropped first.
+    hits and misses count the lookups.
+    A cache can be shared by several simulators, as long as they have the same what-if model:
+    windows with the same initial state, but different inputs, e.g., of another driver, are told apart by their inputs.
+    Windows whose inputs are not all WindowInterpolants are not cached, as they cannot be told apart.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, resolution=1e-6):
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def window(simulator, t0, tf, error_space, *settings):
+        # The part of the keys shared by all candidates of the window [t0, tf],
+        # or None when simulator has no whatif_state, e.g., BikeTrackingSimulatorKinematic, which is not cached,
+        # or its whatif_inputs are not all WindowInterpolants.
+        x0 = simulator.whatif_state(t0, tf)
+        inputs = simulator.whatif_inputs(t0, tf)
+        if x0 is None or inputs is None or not all(isinstance(u, WindowInterpolant) for u in inputs):
+            return None
+        digests = tuple(u.digest() for u in inputs)
+        window = (t0, tf, np.asarray(x0, dtype=float).tobytes(), digests, len(error_space), simulator.time_step)
+        return window + settings
+
+    def key(self, window, parameters):
+        quantized = np.round(np.asarray(parameters, dtype=float) / self.resolution).astype(np.int64)
+        return window + (quantized.tobytes(),)
+
+    def get(self, key):
+        trajectories = self._entries.get(key)
+        if trajectories is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return trajectories
+
+    def put(self, key, trajectories):
+        # The trajectories are stored read-only, as they are handed out to every later lookup.
+        trajectories = np.array(trajectories, dtype=float)
+        trajectories.setflags(write=False)
+        if trajectories.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous.nbytes
+        self._entries[key] = trajectories
+        self.nbytes += trajectories.nbytes
+        while self.nbytes > self.max_bytes:
+            _, dropped = self._entries.popitem(last=False)
+            self.nbytes -= dropped.nbytes
+
+    def __len__(self):
+        return len(self._entries)
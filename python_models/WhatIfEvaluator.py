@@ -0,0 +1,145 @@
+import numpy as np
+
+from WhatIfPool import WhatIfPool
+
+
+def trajectory_cost(trajectories, tracked_solutions):
+    # Sum of squared errors over the last two axes (signal, sample).
+    # Works for a single what-if result and for a stack of them, as returned by run_whatif_batch.
+    return ((trajectories - np.asarray(tracked_solutions))**2).sum(axis=(-2, -1))
+
+
+class WhatIfEvaluator:
+    """
+    Evaluates the candidate parameters of recalibration searches, for a RecalibratingTrackingSimulator
+    or a WhatIfSnapshot of one, which delegate their evaluate_candidate(s), run_whatif_batch and
+    run_whatif_sensitivity here, and count the simulations in their stats.
+    Single candidates are simulated by run_whatif_simulation. Batches are integrated together with the FlatWhatIf
+    of the simulator (see whatif_flat), using the batch_method of its whatif_solver, and one by one if it has none.
+    When processes is set, batches are spread over that many worker processes, started once per recalibration window
+    (see WhatIfPool). close stops them.
+    When early_abort is set, the candidates of searches that give a bound to evaluate_candidates, e.g.,
+    BatchGridSearch, are abandoned as soon as their error over the samples simulated so far exceeds it.
+    Only simulators with a flat what-if model abandon candidates.
+    When the simulator has a whatif_cache, a WhatIfCache, every candidate is looked up there first,
+    and only those not found are simulated, and then cached, except those abandoned early, which have no trajectories.
+    An evaluator serves a single simulator.
+    """
+
+    def __init__(self, processes=None, early_abort=False):
+        self.processes = processes
+        self.early_abort = early_abort
+        self._pool = None
+
+    def evaluate_candidate(self, simulator, parameters, t0, tf, tracked_solutions, error_space, bound=None):
+        if self.early_abort and bound is not None:
+            return self.evaluate_candidates(simulator, [parameters], t0, tf, tracked_solutions, error_space, bound)[0]
+        trajectories = self.run_single(simulator, parameters, t0, tf, tracked_solutions, error_space)
+        return trajectory_cost(trajectories, tracked_solutions)
+
+    def evaluate_candidates(self, simulator, candidates, t0, tf, tracked_solutions, error_space, bound=None):
+        # Searches give the cost they need to beat as bound. With early_abort, the candidates are then simulated
+        # by FlatWhatIf.simulate_costs, which abandons each one as soon as its cost exceeds bound,
+        # so the costs above bound are only lower bounds of the actual costs.
+        candidates = np.asarray(candidates)
+        if self.early_abort and bound is not None and np.isfinite(bound):
+            whatif = simulator.whatif_flat(t0, tf)
+            if whatif is not None:
+                keys, cached = self.lookup(simulator, candidates, t0, tf, error_space, 'batch')
+                costs = np.array([np.nan if c is None else trajectory_cost(c, tracked_solutions) for c in cached])
+                missing = np.isnan(costs)
+                if missing.any():
+                    nfev = whatif.nfev
+                    costs[missing] = whatif.simulate_costs(candidates[missing], t0, tf, simulator.time_step,
+                                                           error_space, tracked_solutions, bound,
+                                                           simulator.whatif_solver.batch_method)
+                    simulator.stats.count(int(missing.sum()), whatif.nfev - nfev)
+                return costs
+        trajectories = self.run_batch(simulator, candidates, t0, tf, tracked_solutions, error_space)
+        return trajectory_cost(trajectories, tracked_solutions)
+
+    def lookup(self, simulator, candidates, t0, tf, error_space, kind):
+        # Returns the cache keys of the candidates, or None when they are not cached,
+        # and what the whatif_cache of simulator has for each one, or None.
+        # kind tells what is simulated, and how: 'single', by run_whatif_simulation, 'batch', by the FlatWhatIf,
+        # or 'sensitivity', by its simulate_sensitivity.
+        cache = simulator.whatif_cache
+        window = None
+        if cache is not None:
+            solver = simulator.whatif_solver
+            method = solver.batch_method if kind == 'batch' else getattr(solver, 'method', None)
+            window = cache.window(simulator, t0, tf, error_space, kind, type(solver).__name__, method)
+        if window is None:
+            return None, [None] * len(candidates)
+        keys = [cache.key(window, p) for p in candidates]
+        return keys, [cache.get(key) for key in keys]
+
+    def run_single(self, simulator, parameters, t0, tf, tracked_solutions, error_space):
+        # run_whatif_simulation, unless the whatif_cache of simulator has its trajectories.
+        keys, (trajectories,) = self.lookup(simulator, [parameters], t0, tf, error_space, 'single')
+        if trajectories is None:
+            trajectories = simulator.run_whatif_simulation(parameters, t0, tf, tracked_solutions, error_space)
+            if keys is not None:
+                simulator.whatif_cache.put(keys[0], trajectories)
+        return trajectories
+
+    def run_batch(self, simulator, candidates, t0, tf, tracked_solutions, error_space):
+        # Returns the tracked trajectories of each candidate, with shape (ncandidates, nsignals, len(error_space)).
+        candidates = np.asarray(candidates)
+        pooled = self._pool is not None and self._pool.window == (t0, tf, len(error_space))
+        whatif = None if pooled else simulator.whatif_flat(t0, tf)
+        if not pooled and whatif is None:
+            return np.array([self.run_single(simulator, p, t0, tf, tracked_solutions, error_space)
+                             for p in candidates])
+        keys, trajectories = self.lookup(simulator, candidates, t0, tf, error_space, 'batch')
+        missing = [i for i, t in enumerate(trajectories) if t is None]
+        if missing:
+            simulated = self.simulate_batch(simulator, whatif, candidates[missing], t0, tf, error_space)
+            for i, t in zip(missing, simulated):
+                trajectories[i] = t
+                if keys is not None:
+                    simulator.whatif_cache.put(keys[i], t)
+        return np.array(trajectories)
+
+    def simulate_batch(self, simulator, whatif, candidates, t0, tf, error_space):
+        # Simulates the candidates with whatif, or with the worker processes when whatif is None.
+        if whatif is None:
+            return self.run_pool(simulator, candidates)
+        method = simulator.whatif_solver.batch_method
+        if self.processes:
+            self.close()
+            self._pool = WhatIfPool(self.processes, whatif, t0, tf, simulator.time_step, error_space, method)
+            return self.run_pool(simulator, candidates)
+        nfev = whatif.nfev
+        trajectories = whatif.simulate_batch(candidates, t0, tf, simulator.time_step, error_space, method)
+        simulator.stats.count(len(candidates), whatif.nfev - nfev)
+        return trajectories
+
+    def run_pool(self, simulator, candidates):
+        trajectories = self._pool.simulate(candidates)
+        simulator.stats.count(len(candidates), self._pool.nfev)
+        return trajectories
+
+    def run_sensitivity(self, simulator, parameters, t0, tf, tracked_solutions, error_space):
+        # Returns the tracked trajectories, as run_whatif_simulation,
+        # and their sensitivities to the parameters, with shape (nsignals, nparams, len(error_space)).
+        whatif = simulator.whatif_flat(t0, tf)
+        if whatif is None:
+            raise ValueError("{} has no flat what-if model (see whatif_flat), which parameter sensitivities need."
+                             .format(type(simulator).__name__))
+        # Cached together, as a single array of shape (nsignals, 1 + nparams, len(error_space)).
+        keys, (cached,) = self.lookup(simulator, [parameters], t0, tf, error_space, 'sensitivity')
+        if cached is not None:
+            return cached[:, 0, :], cached[:, 1:, :]
+        nfev = whatif.nfev
+        trajectories, sensitivities = whatif.simulate_sensitivity(parameters, t0, tf, simulator.time_step,
+                                                                  error_space)
+        simulator.stats.count(1, whatif.nfev - nfev)
+        if keys is not None:
+            simulator.whatif_cache.put(keys[0], np.concatenate([trajectories[:, None, :], sensitivities], axis=1))
+        return trajectories, sensitivities
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
@@ -0,0 +1,44 @@
+import multiprocessing
+
+import numpy as np
+
+# Window of the recalibration being served, in each worker process.
+_window = None
+
+
+def _set_window(window):
+    global _window
+    _window = window
+
+
+def _simulate_chunk(candidates):
+    whatif, t0, tf, h, t_eval, method = _window
+    whatif.nfev = 0
+    return whatif.simulate_batch(candidates, t0, tf, h, t_eval, method), whatif.nfev
+
+
+class WhatIfPool:
+    """
+    Pool of worker processes that simulate what-if candidates over a single recalibration window.
+    The window, i.e., the FlatWhatIf with its recorded inputs and the sample times, is sent to each worker once,
+    when the pool starts. Afterwards, only candidate parameters and trajectories are exchanged.
+    Each worker integrates its share of the candidates together, as run_whatif_batch does.
+    """
+
+    def __init__(self, processes, whatif, t0, tf, h, t_eval, method='RK45'):
+        self.processes = processes
+        self.window = (t0, tf, len(t_eval))
+        # Evaluations of the derivatives in the last call to simulate, over all workers.
+        self.nfev = 0
+        self._pool = multiprocessing.Pool(processes, _set_window, ((whatif, t0, tf, h, t_eval, method),))
+
+    def simulate(self, candidates):
+        # Tracked trajectories of each candidate, with shape (ncandidates, nsignals, len(t_eval)).
+        chunks = [c for c in np.array_split(candidates, self.processes) if len(c) > 0]
+        results = self._pool.map(_simulate_chunk, chunks)
+        self.nfev = sum(nfev for _, nfev in results)
+        return np.concatenate([ys for ys, _ in results])
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,65 @@
+from oomodelling.ModelSolver import ModelSolver
+from scipy.integrate import solve_ivp
+
+from FixedStepSolver import FIXED_STEP_METHODS, fixed_step_solve
+
+# solve_ivp methods that use the Jacobian of the derivatives.
+IMPLICIT_METHODS = ('BDF', 'Radau', 'LSODA')
+
+
+# Ways of integrating a single what-if model, for the whatif_solver of RecalibratingTrackingSimulator.
+# simulate(m, t0, tf, h, t_eval, **inputs) returns the states of the what-if model m at t_eval,
+# and the number of evaluations of its derivatives.
+# inputs are the time-varying inputs of m, given as functions of time, for the compiled derivatives.
+# batch_method is the method used to integrate batches of candidates with a FlatWhatIf (see BatchSolver).
+
+class ModelSolverWhatIf:
+    # Goes through ModelSolver, as TrackingSimulator does, with solver steps of at most a tenth of h.
+    batch_method = 'RK45'
+
+    def simulate(self, m, t0, tf, h, t_eval, **inputs):
+        sol = ModelSolver().simulate(m, t0, tf, h, max_solver_step=h/10.0, t_eval=t_eval)
+        return sol.y, getattr(sol, 'nfev', 0)
+
+
+class CompiledWhatIf:
+    # Integrates the flat derivatives of the what-if model (see compile_derivatives of BikeDynamicModel)
+    # with the solve_ivp method. Implicit methods are given the model's analytic Jacobian.
+    batch_method = 'RK45'
+
+    def __init__(self, method='RK45'):
+        self.method = method
+
+    def simulate(self, m, t0, tf, h, t_eval, **inputs):
+        # The state vector starts with the time, as the solver does.
+        m.set_time(t0)
+        options = {}
+        if self.method in IMPLICIT_METHODS:
+            options['jac'] = m.compile_jacobian(**inputs)
+        sol = solve_ivp(m.compile_derivatives(**inputs), (t0, tf), m.state_vector(),
+                        method=self.method, max_step=h, t_eval=t_eval, **options)
+        assert sol.success, sol.message
+        return sol.y, sol.nfev
+
+
+class FixedStepWhatIf:
+    # Steps the flat derivatives of the what-if model by h with one of FIXED_STEP_METHODS, with no error control,
+    # or by less where the model is too stiff for h (see stable_step).
+    # Batches of candidates are stepped with the same method.
+
+    def __init__(self, method='RK4'):
+        assert method in FIXED_STEP_METHODS, "Unknown fixed-step method {}.".format(method)
+        self.method = method
+        self.batch_method = method
+
+    def simulate(self, m, t0, tf, h, t_eval, **inputs):
+        m.set_time(t0)
+        derivatives = m.compile_derivatives(**inputs)
+        nfev = [0]
+
+        def f(t, x):
+            nfev[0] += 1
+            return derivatives(t, x)
+
+        ys = fixed_step_solve(self.method, f, t0, m.state_vector(), t_eval, h)
+        return ys, nfev[0]
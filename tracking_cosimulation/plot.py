@@ -1,7 +1,18 @@
+import os
+import sys
+
 import pandas as pd
 import matplotlib.pyplot as plt
 
-input = pd.read_csv("output.csv")
+# Results of the co-simulation engine, output.csv by default, or columnar results written by CoSimulationMaster,
+# e.g., python plot.py results.cols, which are memory-mapped instead of parsed.
+path = sys.argv[1] if len(sys.argv) > 1 else "output.csv"
+if path.endswith(".cols"):
+  sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_models"))
+  from ColumnarResults import read_columns
+  input = read_columns(path)
+else:
+  input = pd.read_csv(path)
 
 _, (p1, p2, p3, p4) = plt.subplots(1, 4)
 